@@ -1,17 +1,25 @@
 from flask import Flask
 from flask_cors import CORS
-from routes import health, geocode, weather, suggest, itinerary
+from routes import health, geocode, weather, suggest, itinerary, admin
+import load
+import profiling
+import responses
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 app.config['TIMEOUT'] = 120
 
+load.init_app(app)
+profiling.init_app(app)
+responses.init_app(app)
+
 app.register_blueprint(health.bp)
 app.register_blueprint(geocode.bp)
 app.register_blueprint(weather.bp)
 app.register_blueprint(suggest.bp)
 app.register_blueprint(itinerary.bp)
+app.register_blueprint(admin.bp)
 
 if __name__ == '__main__':
     print("=" * 70)
@@ -20,10 +28,13 @@ if __name__ == '__main__':
     print(f"Server starting at: http://localhost:5000")
     print(f"\nAvailable Endpoints:")
     print(f"  • GET  /health                  - Health check")
+    print(f"  • GET  /ready                   - Readiness and load")
     print(f"  • GET  /api/geocode             - City to coordinates")
     print(f"  • GET  /api/weather             - Weather data")
     print(f"  • POST /api/suggest-quick       - AI music suggestions")
     print(f"  • POST /api/itinerary           - Day-by-day itinerary")
+    print(f"  • POST /api/itinerary/route     - Multi-city itinerary")
+    print(f"  • PATCH /api/itinerary/<id>     - Regenerate one day or slot")
     print("=" * 70)
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
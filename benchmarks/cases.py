@@ -0,0 +1,81 @@
+"""Benchmark cases for the CPU-bound helpers of the routes, built from upstream and LLM payload fixtures"""
+import json
+import os
+from datetime import datetime
+from forecast import _project
+from routes.itinerary import group_daily_weather, summarize_days, format_weather_summary, build_itinerary_prompt
+from routes.suggest import build_suggest_prompt, build_guided_prompt
+from routes.weather import build_hourly_forecast, HOURLY_FIELDS
+from utils import extract_json
+from venues import nearest_venues
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DAY_RANGES = (1, 3, 7)
+ITINERARY_HOURLY = frozenset(('temperature_2m', 'precipitation', 'weathercode'))
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return json.load(f) if name.endswith('.json') else f.read()
+
+
+def _window(forecast, days, hourly, hours=None):
+    """Project the recorded forecast the way fetch_forecast would for a `days`-long request"""
+    dates = sorted({t[:10] for t in forecast['hourly']['time']})
+    wanted = {
+        'hourly': hourly,
+        'daily': frozenset(),
+        'current': False,
+        'start_date': dates[0],
+        'end_date': dates[days - 1]
+    }
+    return _project(forecast, wanted, hours)['hourly']
+
+
+def _extract(text):
+    try:
+        return extract_json(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def build_cases():
+    """Return {name: (function, args)}; each call of function(*args) is one benchmark iteration"""
+    forecast = _fixture('forecast_tokyo_7d.json')
+    start_dt = datetime.strptime(forecast['hourly']['time'][0][:10], '%Y-%m-%d')
+    cases = {}
+
+    for days in DAY_RANGES:
+        itinerary_hourly = _window(forecast, days, ITINERARY_HOURLY, frozenset((9, 14, 18)))
+        daily_weather = group_daily_weather(itinerary_hourly)
+        daily_summaries = summarize_days(daily_weather)
+        weather_summary = format_weather_summary(daily_summaries)
+
+        cases[f'group_daily_weather[{days}d]'] = (group_daily_weather, (itinerary_hourly,))
+        cases[f'summarize_days[{days}d]'] = (summarize_days, (daily_weather,))
+        cases[f'format_weather_summary[{days}d]'] = (format_weather_summary, (daily_summaries,))
+        for language in ('ja', 'en'):
+            cases[f'build_itinerary_prompt[{language},{days}d]'] = (build_itinerary_prompt, (
+                language, '東京', '東京都', start_dt.strftime('%Y-%m-%d'), start_dt, days,
+                ['jazz', 'live music'], '雨でも楽しめる場所', weather_summary
+            ))
+
+        weather_hourly = _window(forecast, days, frozenset(HOURLY_FIELDS.values()))
+        for response_format in ('rows', 'columnar'):
+            cases[f'build_hourly_forecast[{response_format},{days}d]'] = (build_hourly_forecast, (
+                weather_hourly, list(HOURLY_FIELDS), days * 24, response_format == 'columnar'
+            ))
+
+    candidates = nearest_venues(35.6595, 139.7005, 'rain', k=8)
+    cases['build_suggest_prompt'] = (build_suggest_prompt, (
+        '渋谷', 'Slight rain', 18.2, ['jazz'], '雨の日に音楽を楽しみたい'
+    ))
+    cases['build_guided_prompt'] = (build_guided_prompt, (
+        '渋谷', 'Slight rain', 18.2, ['jazz'], '雨の日に音楽を楽しみたい', candidates
+    ))
+
+    for name in ('llm_suggest_fenced', 'llm_itinerary_1d_plain', 'llm_itinerary_7d_fenced',
+                 'llm_itinerary_7d_prose', 'llm_itinerary_7d_truncated'):
+        cases[f'extract_json[{name[4:]}]'] = (_extract, (_fixture(f'{name}.txt'),))
+
+    return cases
@@ -0,0 +1,164 @@
+"""Run the micro-benchmarks and compare them with the stored baseline.
+
+    python -m benchmarks.run                     # compare, exit 1 on regression
+    python -m benchmarks.run --update-baseline   # record a new baseline
+    python -m benchmarks.run -k extract_json     # only matching cases
+
+Time is the per-call time with garbage collection off, divided by the time of
+a fixed calibration loop measured alongside it, so results are compared in
+calibration units rather than machine-specific microseconds. Allocation is the peak traced memory of a single call. To gate a
+change on absolute times instead, record a baseline from the old tree with
+`--update-baseline --baseline before.json` and compare with `--baseline before.json`.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from benchmarks.cases import build_cases
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Allocation differences below this are treated as noise regardless of the ratio
+MIN_ALLOC_DELTA_BYTES = 256
+
+
+def _calibration_loop():
+    """Fixed mix of the work the cases do: string formatting, dict and list building, joins"""
+    rows = [{'time': f'2025-01-01T{i % 24:02d}:00', 'value': i * 0.5} for i in range(100)]
+    return ','.join(row['time'] for row in rows if row['value'] > 10)
+
+
+def _timed(func, args, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return time.perf_counter() - started
+
+
+def _loops(func, args, min_time):
+    number = 1
+    while _timed(func, args, number) < min_time and number < 1_000_000:
+        number *= 2
+    return number
+
+
+def measure(func, args, repeat=7, min_time=0.02):
+    """Return (microseconds per call, time in calibration units, peak bytes allocated by one call).
+
+    Each repeat times the case right after the calibration loop and the
+    median ratio is kept, so CPU frequency changes during the run cancel out.
+    Fast cases are looped until a repeat takes `min_time`, so their ratios are
+    as stable as those of slow ones and the same relative threshold applies.
+    """
+    func(*args)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        number = _loops(func, args, min_time)
+        calibration_number = _loops(_calibration_loop, (), min_time)
+        times = []
+        ratios = []
+        for _ in range(repeat):
+            calibration = _timed(_calibration_loop, (), calibration_number) / calibration_number
+            times.append(_timed(func, args, number) / number)
+            ratios.append(times[-1] / calibration)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times) * 1e6, statistics.median(ratios), peak - baseline
+
+
+def compare(results, baseline, time_threshold, alloc_threshold):
+    """List (name, metric, old, new) for every measurement that regressed past its threshold"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if result['time'] > old['time'] * (1 + time_threshold):
+            regressions.append((name, 'time', old['time'], result['time']))
+        if (result['peak_bytes'] > old['peak_bytes'] * (1 + alloc_threshold)
+                and result['peak_bytes'] - old['peak_bytes'] > MIN_ALLOC_DELTA_BYTES):
+            regressions.append((name, 'peak_bytes', old['peak_bytes'], result['peak_bytes']))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'results': {}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the CPU hot paths of the API')
+    parser.add_argument('-k', dest='pattern', help='only run cases whose name contains this string')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file (default: %(default)s)')
+    parser.add_argument('--update-baseline', action='store_true', help='write results to the baseline file')
+    parser.add_argument('--time-threshold', type=float, default=0.25,
+                        help='allowed relative slowdown before failing (default: %(default)s)')
+    parser.add_argument('--alloc-threshold', type=float, default=0.10,
+                        help='allowed relative growth in peak allocation (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=7, help='timing repeats per case (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    old_results = baseline.get('results', {})
+
+    results = {}
+    print(f'{"case":<45} {"time (us)":>10} {"units":>8} {"baseline":>9} {"peak (B)":>10} {"baseline":>10}')
+    for name, (func, func_args) in build_cases().items():
+        if args.pattern and args.pattern not in name:
+            continue
+        time_us, relative, peak_bytes = measure(func, func_args, repeat=args.repeat)
+        results[name] = {'time': round(relative, 4), 'peak_bytes': peak_bytes}
+
+        old = old_results.get(name, {})
+        print(f'{name:<45} {time_us:>10.2f} {relative:>8.3f} {old.get("time", "-"):>9} '
+              f'{peak_bytes:>10} {old.get("peak_bytes", "-"):>10}')
+
+    if args.update_baseline:
+        merged = dict(old_results, **results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': dict(sorted(merged.items()))
+            }, f, indent=2)
+            f.write('\n')
+        print(f'\nBaseline written to {args.baseline}')
+        return 0
+
+    if baseline.get('python') and baseline['python'] != platform.python_version():
+        print(f'\nNote: baseline was recorded on Python {baseline["python"]}, '
+              f'running {platform.python_version()}')
+
+    regressions = compare(results, old_results, args.time_threshold, args.alloc_threshold)
+    if regressions:
+        print('\nRegressions:')
+        for name, metric, old, new in regressions:
+            print(f'  {name} {metric}: {old} -> {new} ({(new / old - 1) * 100:+.0f}%)')
+        return 1
+
+    print('\nNo regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Measure worker cold-start time in fresh interpreters.
+
+    python -m benchmarks.startup [--runs 10]
+
+Reports the median time to import the app and serve a first /health request,
+and the same with the Gemini SDK imported up front, which is what every
+worker paid before the SDK was imported lazily.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import time
+started = time.perf_counter()
+{preamble}
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/health')
+print(imported - started, time.perf_counter() - started)
+"""
+
+SCENARIOS = {
+    'lazy (current)': '',
+    'eager LLM SDK': 'from google import genai',
+}
+
+
+def run_once(preamble):
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(preamble=preamble)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    imported, first_response = map(float, output.split())
+    return imported * 1000, first_response * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker cold-start benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per scenario (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    print(f'{"scenario":<20} {"import app (ms)":>16} {"first /health (ms)":>20}')
+    for name, preamble in SCENARIOS.items():
+        run_once(preamble)
+        samples = [run_once(preamble) for _ in range(args.runs)]
+        imported = statistics.median(s[0] for s in samples)
+        first_response = statistics.median(s[1] for s in samples)
+        print(f'{name:<20} {imported:>16.1f} {first_response:>20.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
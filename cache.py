@@ -0,0 +1,359 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import metrics
+from config import CACHE_BACKEND, CACHE_PATH, CACHE_URL, CACHE_MAX_BYTES, STORE_PATH, STORE_URL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_THRESHOLD = 1024
+
+
+def dumps(value):
+    """Serialize a cache value compactly: JSON, zlib-compressed when large.
+
+    Cached data can be written by anyone with access to the store, so only
+    plain JSON types are stored; tuples come back as lists.
+    """
+    if orjson is not None:
+        blob = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        blob = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(blob) >= COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(blob)
+    return b'j' + blob
+
+
+def loads(blob):
+    """Inverse of `dumps`; returns None for data in any other format"""
+    try:
+        if blob[:1] == b'z':
+            blob = b'j' + zlib.decompress(blob[1:])
+        if blob[:1] != b'j':
+            return None
+        return orjson.loads(blob[1:]) if orjson is not None else json.loads(blob[1:])
+    except (zlib.error, ValueError):
+        return None
+
+
+def _record(key, hit):
+    namespace = key.split(':', 1)[0]
+    metrics.incr(f'cache.{namespace}.{"hits" if hit else "misses"}')
+
+
+class CacheBackend:
+    """Key-value cache with per-entry TTLs.
+
+    Keys are strings whose prefix up to the first ':' names the namespace used
+    for hit/miss metrics. Values are JSON-serializable objects; `get` returns
+    None for missing or expired keys.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key, amount, ttl):
+        """Atomically add `amount` to an integer counter and return the new value.
+
+        A missing or expired counter starts from zero and lives for `ttl` seconds.
+        """
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        return {key: value for key in keys if (value := self.get(key)) is not None}
+
+    def set_many(self, items, ttl):
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache bounded by the serialized size of its values.
+
+    With `max_bytes=None` nothing is evicted for size; expired entries are
+    dropped on write instead.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._size = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] <= now:
+                self._remove(key)
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+        value = loads(entry[1]) if entry else None
+        _record(key, value is not None)
+        return value
+
+    def set(self, key, value, ttl):
+        blob = dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (now + ttl, blob)
+            self._size += len(blob)
+            if self.max_bytes is None:
+                for stale in [k for k, e in self._entries.items() if e[0] <= now]:
+                    self._remove(stale)
+                return
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter[0] <= now:
+                counter = [now + ttl, 0]
+                self._counters[key] = counter
+                for stale in [k for k, c in self._counters.items() if c[0] <= now]:
+                    del self._counters[stale]
+            counter[1] += amount
+            return counter[1]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._size -= len(entry[1])
+
+
+class SharedDiskCache(CacheBackend):
+    """SQLite-backed cache shared by every worker process on the host.
+
+    The database lives at `path` (point it at /dev/shm to keep it in shared
+    memory). When the total stored size exceeds `max_bytes`, expired entries
+    are dropped first and then the entries closest to expiry; with
+    `max_bytes=None` only expired entries are dropped.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            _check_private(directory)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'expires_at REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS counters ('
+            'key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        value = loads(row[0]) if row else None
+        _record(key, value is not None)
+        return value
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connect().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?',
+            (*keys, time.time())
+        ).fetchall()
+        found = {key: value for key, blob in rows if (value := loads(blob)) is not None}
+        for key in keys:
+            _record(key, key in found)
+        return found
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl):
+        expires_at = time.time() + ttl
+        rows = []
+        for key, value in items.items():
+            blob = dumps(value)
+            rows.append((key, blob, expires_at, len(blob)))
+
+        conn = self._connect()
+        conn.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', rows)
+
+        self._writes += len(rows)
+        if self._writes >= self.EVICT_EVERY:
+            self._writes = 0
+            self._evict(conn)
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def incr(self, key, amount, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM counters WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+            if row:
+                value = row[0] + amount
+                conn.execute('UPDATE counters SET value = ? WHERE key = ?', (value, key))
+            else:
+                value = amount
+                conn.execute('INSERT OR REPLACE INTO counters VALUES (?, ?, ?)', (key, value, now + ttl))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def _evict(self, conn):
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        conn.execute('DELETE FROM counters WHERE expires_at <= ?', (time.time(),))
+        if self.max_bytes is None:
+            return
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in conn.execute('SELECT key, size FROM cache ORDER BY expires_at'):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany('DELETE FROM cache WHERE key = ?', doomed)
+
+
+def _check_private(directory):
+    """Refuse a cache directory that another user owns or can write to"""
+    info = os.stat(directory)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise PermissionError(f'{directory} is owned by another user')
+    if info.st_mode & 0o022:
+        raise PermissionError(f'{directory} is writable by other users')
+
+
+class RemoteCache(CacheBackend):
+    """Adapter for a networked key-value store.
+
+    `client` needs `get(key)`, `set(key, value, ex=seconds)`, `delete(key)`,
+    `incrby(key, amount)` and `expire(key, seconds)`, as provided by redis-py;
+    any object with that interface works as a stand-in. Size-based eviction is left to the server (e.g. maxmemory).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        blob = self.client.get(key)
+        value = loads(blob) if blob is not None else None
+        _record(key, value is not None)
+        return value
+
+    def set(self, key, value, ttl):
+        self.client.set(key, dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key, amount, ttl):
+        value = int(self.client.incrby(key, amount))
+        if value == amount:
+            self.client.expire(key, max(1, int(ttl)))
+        return value
+
+
+_backends = {}
+_backends_pid = None
+_backends_lock = threading.Lock()
+
+
+def _backend(name, factory):
+    global _backends_pid
+    if _backends_pid == os.getpid() and name in _backends:
+        return _backends[name]
+
+    with _backends_lock:
+        if _backends_pid != os.getpid():
+            _backends.clear()
+            _backends_pid = os.getpid()
+        if name not in _backends:
+            _backends[name] = factory()
+    return _backends[name]
+
+
+def _create(path, url, max_bytes):
+    if CACHE_BACKEND == 'remote':
+        return RemoteCache.from_url(url)
+    if CACHE_BACKEND == 'shared':
+        try:
+            return SharedDiskCache(path, max_bytes)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning('Shared cache unavailable at %s (%s); using in-process cache', path, e)
+    return MemoryCache(max_bytes)
+
+
+def get_cache():
+    """Return this process's cache backend, as configured by CACHE_BACKEND"""
+    return _backend('cache', lambda: _create(CACHE_PATH, CACHE_URL, CACHE_MAX_BYTES))
+
+
+def get_store():
+    """Return this process's store for user data that must not be evicted (stored itineraries).
+
+    Same backend type as the cache, but kept apart from it: entries only
+    disappear when their TTL runs out, never to make room for cached responses.
+    """
+    return _backend('store', lambda: _create(STORE_PATH, STORE_URL, None))
@@ -1,9 +1,101 @@
 import os
+import tempfile
 
 GEOCODING_API = "https://geocoding-api.open-meteo.com/v1/search"
 WEATHER_API = "https://api.open-meteo.com/v1/jma"
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# Country fallback for geocoding, per route: 'none' (filtered query only),
+# 'sequential' (unfiltered query only after an empty filtered one) or
+# 'parallel' (both queries at once, filtered results preferred).
+GEOCODE_FALLBACK_MODES = {
+    'geocode': os.getenv('GEOCODE_FALLBACK_GEOCODE', 'parallel'),
+    'weather': os.getenv('GEOCODE_FALLBACK_WEATHER', 'none'),
+    'suggest': os.getenv('GEOCODE_FALLBACK_SUGGEST', 'none'),
+    'itinerary': os.getenv('GEOCODE_FALLBACK_ITINERARY', 'none')
+}
+
+# Forecast responses are shared between queries whose fields, hours and dates
+# they already cover, for FORECAST_CACHE_TTL seconds.
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', '600'))
+
+# Response compression and HTTP caching
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', '6'))
+GEOCODE_CACHE_MAX_AGE = int(os.getenv('GEOCODE_CACHE_MAX_AGE', '86400'))
+
+# Cache backend shared by the forecast, geocoding and HTTP validator caches:
+# 'memory' (per process), 'shared' (SQLite file used by all workers on the
+# host) or 'remote' (redis-compatible server at CACHE_URL).
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'shared')
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'ongaku-cache', 'cache.sqlite'))
+CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', '86400'))
+# Stored itineraries live in a separate store of the same backend type that is
+# never evicted for size; for 'remote', point STORE_URL at a database whose
+# server does not evict keys (maxmemory-policy noeviction).
+STORE_PATH = os.getenv('STORE_PATH', os.path.join(os.path.dirname(CACHE_PATH), 'store.sqlite'))
+STORE_URL = os.getenv('STORE_URL', CACHE_URL)
+ITINERARY_TTL = int(os.getenv('ITINERARY_TTL', str(7 * 86400)))
+ROUTE_MAX_LEGS = int(os.getenv('ROUTE_MAX_LEGS', '5'))
+
+METRICS_WINDOW_SIZE = int(os.getenv('METRICS_WINDOW_SIZE', '200'))
+
+# Saturation thresholds above which /ready reports the worker as not ready
+READY_MAX_INFLIGHT = int(os.getenv('READY_MAX_INFLIGHT', '32'))
+READY_MAX_LLM_INFLIGHT = int(os.getenv('READY_MAX_LLM_INFLIGHT', '8'))
+READY_MAX_QUEUED = int(os.getenv('READY_MAX_QUEUED', '32'))
+READY_MAX_UPSTREAM_P95 = float(os.getenv('READY_MAX_UPSTREAM_P95', '8'))
+READY_MAX_ERROR_RATE = float(os.getenv('READY_MAX_ERROR_RATE', '0.5'))
+READY_MIN_SAMPLES = int(os.getenv('READY_MIN_SAMPLES', '10'))
+
+# Per-request profiling: requests carrying `X-Profile: <PROFILE_ADMIN_TOKEN>`,
+# plus a random PROFILE_SAMPLE_RATE fraction of all requests, are profiled and
+# saved under PROFILE_DIR. Both off by default, in which case no hook is installed.
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ongaku-profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+
+# Threads per worker process for concurrent Gemini generations (route legs, refreshed days)
+LLM_WORKERS = int(os.getenv('LLM_WORKERS', '8'))
+
+# Hedged Gemini requests: if no chunk has arrived after the given percentile of
+# recent time-to-first-token, a second identical stream is started.
+GEMINI_HEDGE_ENABLED = os.getenv('GEMINI_HEDGE_ENABLED', 'false').lower() == 'true'
+GEMINI_HEDGE_PERCENTILE = float(os.getenv('GEMINI_HEDGE_PERCENTILE', '95'))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20'))
+GEMINI_HEDGE_MAX_RATE = float(os.getenv('GEMINI_HEDGE_MAX_RATE', '0.1'))
+
+# Upstream quota budgets (per minute, per day), counted across all workers in
+# the cache backend. Off by default; the limits below are the free tiers, so set
+# your plan's limits before enabling. Geocoding and forecast calls share the
+# Open-Meteo budget, and a 'parallel' GEOCODE_FALLBACK_* lookup spends two units
+# of it on every geocoding cache miss.
+QUOTA_ENABLED = os.getenv('QUOTA_ENABLED', 'false').lower() == 'true'
+QUOTA_LIMITS = {
+    'open-meteo': (
+        int(os.getenv('QUOTA_OPEN_METEO_PER_MINUTE', '600')),
+        int(os.getenv('QUOTA_OPEN_METEO_PER_DAY', '10000'))
+    ),
+    'gemini': (
+        int(os.getenv('QUOTA_GEMINI_PER_MINUTE', '15')),
+        int(os.getenv('QUOTA_GEMINI_PER_DAY', '1500'))
+    )
+}
+QUOTA_SERVICES = {'geocoding': 'open-meteo', 'forecast': 'open-meteo', 'gemini': 'gemini'}
+# Share of each budget a priority class may use before it is turned away, so
+# interactive requests keep headroom when bulk or prewarm traffic is heavy.
+QUOTA_PRIORITY_SHARES = {
+    'interactive': float(os.getenv('QUOTA_SHARE_INTERACTIVE', '0.95')),
+    'standard': float(os.getenv('QUOTA_SHARE_STANDARD', '0.8')),
+    'bulk': float(os.getenv('QUOTA_SHARE_BULK', '0.5'))
+}
+# How long an expired forecast may still be served when its quota is exhausted
+FORECAST_STALE_TTL = int(os.getenv('FORECAST_STALE_TTL', str(6 * 3600)))
+
 WEATHER_CONDITIONS = {
     0: 'Clear sky',
     1: 'Mainly clear',
@@ -29,4 +121,37 @@ WEATHER_CONDITIONS = {
     95: 'Thunderstorm',
     96: 'Thunderstorm with slight hail',
     99: 'Thunderstorm with heavy hail'
-}
\ No newline at end of file
+}
+
+# Bundled venue catalog used for instant (non-LLM) and LLM-guided suggestions
+VENUE_CATALOG_PATH = os.getenv(
+    'VENUE_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'venues.json')
+)
+VENUE_CELL_DEGREES = float(os.getenv('VENUE_CELL_DEGREES', '0.05'))
+VENUE_SEARCH_RADIUS_KM = float(os.getenv('VENUE_SEARCH_RADIUS_KM', '15'))
+SUGGEST_CANDIDATES = int(os.getenv('SUGGEST_CANDIDATES', '8'))
+
+# Suggestions precomputed by precompute.py for (city, weather category,
+# temperature band, preferences) combinations and served without an LLM call
+SUGGEST_TEMPERATURE_BAND = int(os.getenv('SUGGEST_TEMPERATURE_BAND', '5'))
+SUGGEST_PRECOMPUTE_TTL = int(os.getenv('SUGGEST_PRECOMPUTE_TTL', '86400'))
+PRECOMPUTE_MATRIX_PATH = os.getenv(
+    'PRECOMPUTE_MATRIX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'precompute.json')
+)
+
+# Coarse weather categories used to decide whether a forecast change matters
+WEATHER_CATEGORIES = {
+    0: 'clear', 1: 'clear',
+    2: 'cloudy', 3: 'cloudy',
+    45: 'fog', 48: 'fog',
+    51: 'rain', 53: 'rain', 55: 'rain',
+    61: 'rain', 63: 'rain', 65: 'rain',
+    80: 'rain', 81: 'rain', 82: 'rain',
+    71: 'snow', 73: 'snow', 75: 'snow', 77: 'snow', 85: 'snow', 86: 'snow',
+    95: 'thunderstorm', 96: 'thunderstorm', 99: 'thunderstorm'
+}
+
+# Precipitation (mm/h) at or above which a time slot counts as wet
+PRECIPITATION_THRESHOLD = float(os.getenv('PRECIPITATION_THRESHOLD', '0.5'))
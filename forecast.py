@@ -0,0 +1,164 @@
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import metrics
+from cache import get_cache
+from config import WEATHER_API, FORECAST_CACHE_TTL, FORECAST_STALE_TTL
+from quota import QuotaExceeded
+from utils import get_json
+
+
+def fetch_forecast(latitude, longitude, timezone='Asia/Tokyo', hourly=(), hours=None,
+                   daily=(), current=False, start_date=None, end_date=None, forecast_days=1):
+    """Fetch only the forecast data a caller declares it needs.
+
+    `hourly` and `daily` are Open-Meteo variable names, `hours` optionally limits
+    hourly data to those hours of the day and `current` asks for
+    `current_weather`. The smallest matching Open-Meteo request is made unless a
+    cached response for the same location already covers it. When the forecast
+    quota is exhausted, a covering response up to FORECAST_STALE_TTL old is
+    served instead. Returns a dict shaped like the Open-Meteo response holding
+    only the requested sections.
+    """
+    hourly = frozenset(hourly)
+    daily = frozenset(daily)
+    hours = frozenset(hours) if hours is not None else None
+
+    if hourly or daily:
+        if start_date:
+            end_date = end_date or start_date
+        else:
+            start_date, end_date = _default_dates(timezone, forecast_days)
+    else:
+        start_date = end_date = None
+
+    key = f'forecast:{round(float(latitude), 4)}:{round(float(longitude), 4)}:{timezone}'
+    wanted = {
+        'hourly': hourly,
+        'daily': daily,
+        'current': current,
+        'start_date': start_date,
+        'end_date': end_date
+    }
+
+    entries = [_decode(e) for e in get_cache().get(key) or []]
+    now = time.time()
+    entry = next((e for e in entries if _covers(e, wanted, now, FORECAST_CACHE_TTL)), None)
+    if entry is None:
+        try:
+            entry = _fetch(latitude, longitude, timezone, wanted, forecast_days)
+        except QuotaExceeded:
+            entry = next((e for e in entries if _covers(e, wanted, now, FORECAST_STALE_TTL)), None)
+            if entry is None:
+                raise
+            metrics.incr('forecast.stale_served')
+            return _project(entry['data'], wanted, hours)
+
+        if start_date or not (hourly or daily):
+            entries = [
+                e for e in entries
+                if now - e['fetched_at'] <= FORECAST_STALE_TTL and not _covers(e, wanted, now, FORECAST_STALE_TTL)
+            ]
+            get_cache().set(key, [_encode(e) for e in entries + [entry]], max(FORECAST_CACHE_TTL, FORECAST_STALE_TTL))
+
+    return _project(entry['data'], wanted, hours)
+
+
+def freshness_seconds():
+    """Seconds a forecast fetched now may be served: until the next hourly update, at most the cache TTL"""
+    now = time.time()
+    return max(1, min(FORECAST_CACHE_TTL, int(3600 - now % 3600)))
+
+
+def _default_dates(timezone, forecast_days):
+    try:
+        today = datetime.now(ZoneInfo(timezone)).date()
+    except (ZoneInfoNotFoundError, ValueError):
+        return None, None
+    end = today + timedelta(days=max(1, int(forecast_days)) - 1)
+    return today.isoformat(), end.isoformat()
+
+
+def _fetch(latitude, longitude, timezone, wanted, forecast_days):
+    params = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timezone': timezone
+    }
+    if wanted['hourly']:
+        params['hourly'] = ','.join(sorted(wanted['hourly']))
+    if wanted['daily']:
+        params['daily'] = ','.join(sorted(wanted['daily']))
+    if wanted['current']:
+        params['current_weather'] = 'true'
+
+    if wanted['start_date']:
+        params['start_date'] = wanted['start_date']
+        params['end_date'] = wanted['end_date']
+    else:
+        params['forecast_days'] = forecast_days
+
+    data = get_json(WEATHER_API, params, 'forecast')
+    return dict(wanted, data=data, fetched_at=time.time())
+
+
+def _encode(entry):
+    """Cache form of an entry: variable sets as sorted lists, since the cache stores JSON"""
+    return dict(entry, hourly=sorted(entry['hourly']), daily=sorted(entry['daily']))
+
+
+def _decode(entry):
+    return dict(entry, hourly=frozenset(entry['hourly']), daily=frozenset(entry['daily']))
+
+
+def _covers(entry, wanted, now, max_age):
+    if now - entry['fetched_at'] > max_age:
+        return False
+    if wanted['current'] and not entry['current']:
+        return False
+    if not (wanted['hourly'] <= entry['hourly'] and wanted['daily'] <= entry['daily']):
+        return False
+    if wanted['hourly'] or wanted['daily']:
+        return (entry['start_date'] is not None
+                and wanted['start_date'] is not None
+                and entry['start_date'] <= wanted['start_date']
+                and entry['end_date'] >= wanted['end_date'])
+    return True
+
+
+def _project(data, wanted, hours):
+    """Trim an Open-Meteo response down to the requested variables, dates and hours"""
+    result = {}
+    for meta in ('latitude', 'longitude', 'timezone', 'elevation'):
+        if meta in data:
+            result[meta] = data[meta]
+
+    if wanted['current']:
+        result['current_weather'] = data.get('current_weather', {})
+
+    if wanted['hourly']:
+        source = data.get('hourly', {})
+        keep = [
+            i for i, t in enumerate(source.get('time', []))
+            if _in_range(t[:10], wanted) and (hours is None or int(t[11:13]) in hours)
+        ]
+        result['hourly'] = {
+            name: [source.get(name, [])[i] for i in keep]
+            for name in ('time', *wanted['hourly'])
+        }
+
+    if wanted['daily']:
+        source = data.get('daily', {})
+        keep = [i for i, t in enumerate(source.get('time', [])) if _in_range(t, wanted)]
+        result['daily'] = {
+            name: [source.get(name, [])[i] for i in keep]
+            for name in ('time', *wanted['daily'])
+        }
+
+    return result
+
+
+def _in_range(date, wanted):
+    if wanted['start_date'] is None:
+        return True
+    return wanted['start_date'] <= date <= wanted['end_date']
@@ -0,0 +1,32 @@
+"""Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and workers are forked from it, so
+module-level read-only data (condition tables, the venue catalog and its grid
+index) is shared copy-on-write instead of being rebuilt by every worker.
+Anything holding sockets, threads or file handles (Gemini client, cache
+connections, the upstream thread pool) is created lazily inside each worker.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Handlers mostly wait on Open-Meteo and Gemini, so each worker serves several requests with threads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = '-'
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collection in the workers does not write to (and un-share) those pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    server.log.info('Worker %s forked with %d frozen objects', worker.pid, gc.get_freeze_count())
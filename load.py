@@ -0,0 +1,100 @@
+from flask import request
+import metrics
+from config import (
+    READY_MAX_INFLIGHT, READY_MAX_LLM_INFLIGHT, READY_MAX_QUEUED, READY_MAX_UPSTREAM_P95,
+    READY_MAX_ERROR_RATE, READY_MIN_SAMPLES
+)
+from utils import executor, llm_executor
+
+UPSTREAMS = {'geocoding': 'upstream.geocoding', 'forecast': 'upstream.forecast', 'gemini': 'gemini'}
+
+# Probes and metrics scrapes are not load and would count themselves
+UNTRACKED_BLUEPRINTS = {'health', 'admin'}
+
+
+def _tracked():
+    return request.endpoint is not None and request.blueprint not in UNTRACKED_BLUEPRINTS
+
+
+def _request_started():
+    if _tracked():
+        metrics.adjust(f'http.inflight.{request.endpoint}', 1)
+
+
+def _request_finished(exc):
+    if _tracked():
+        metrics.adjust(f'http.inflight.{request.endpoint}', -1)
+
+
+def _queued(pool):
+    return metrics.gauges(f'pool.{pool.name}.queued').get(f'pool.{pool.name}.queued', 0)
+
+
+def report():
+    """Saturation of this worker, with the reasons it should not take traffic, plus upstream health.
+
+    Readiness depends only on local saturation: when an upstream degrades every
+    worker sees it at once, and taking them all out of rotation would also stop
+    cached and stale responses from being served. Unhealthy upstreams are listed
+    under `warnings` instead.
+    """
+    inflight = {
+        name[len('http.inflight.'):]: value
+        for name, value in metrics.gauges('http.inflight.').items() if value
+    }
+    llm_inflight = metrics.gauges('gemini.inflight').get('gemini.inflight', 0)
+    queued = _queued(executor)
+    llm_queued = _queued(llm_executor)
+
+    reasons = []
+    if sum(inflight.values()) >= READY_MAX_INFLIGHT:
+        reasons.append(f'{sum(inflight.values())} requests in flight (limit {READY_MAX_INFLIGHT})')
+    if llm_inflight >= READY_MAX_LLM_INFLIGHT:
+        reasons.append(f'{llm_inflight} LLM calls in flight (limit {READY_MAX_LLM_INFLIGHT})')
+    if queued >= READY_MAX_QUEUED:
+        reasons.append(f'{queued} upstream calls queued (limit {READY_MAX_QUEUED})')
+    if llm_queued >= READY_MAX_QUEUED:
+        reasons.append(f'{llm_queued} LLM generations queued (limit {READY_MAX_QUEUED})')
+
+    upstreams = {}
+    warnings = []
+    for service, prefix in UPSTREAMS.items():
+        latency = f'{prefix}.ttft' if service == 'gemini' else f'{prefix}.latency'
+        samples = metrics.sample_count(f'{prefix}.failed')
+        p95 = metrics.percentile(latency, 95)
+        error_rate = metrics.mean(f'{prefix}.failed')
+        upstreams[service] = {
+            'samples': samples,
+            'p95_seconds': round(p95, 3) if p95 is not None else None,
+            'error_rate': round(error_rate, 3) if error_rate is not None else None
+        }
+        if samples < READY_MIN_SAMPLES:
+            continue
+        if p95 is not None and p95 > READY_MAX_UPSTREAM_P95:
+            warnings.append(f'{service} p95 latency {p95:.1f}s (limit {READY_MAX_UPSTREAM_P95}s)')
+        if error_rate > READY_MAX_ERROR_RATE:
+            warnings.append(f'{service} error rate {error_rate:.0%} (limit {READY_MAX_ERROR_RATE:.0%})')
+
+    counters = metrics.snapshot()['counters']
+    cache = {}
+    for namespace in sorted({name.split('.')[1] for name in counters if name.startswith('cache.')}):
+        hits = counters.get(f'cache.{namespace}.hits', 0)
+        misses = counters.get(f'cache.{namespace}.misses', 0)
+        cache[namespace] = round(hits / (hits + misses), 3) if hits + misses else None
+
+    return {
+        'ready': not reasons,
+        'reasons': reasons,
+        'warnings': warnings,
+        'in_flight': inflight,
+        'llm': {'in_flight': llm_inflight, 'limit': READY_MAX_LLM_INFLIGHT,
+                'queued': llm_queued, 'workers': llm_executor.workers},
+        'upstream_queue': {'queued': queued, 'workers': executor.workers},
+        'upstreams': upstreams,
+        'cache_hit_rates': cache
+    }
+
+
+def init_app(app):
+    app.before_request(_request_started)
+    app.teardown_request(_request_finished)
@@ -0,0 +1,87 @@
+import threading
+from collections import deque
+from config import METRICS_WINDOW_SIZE
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_windows = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def adjust(name, delta):
+    """Move the gauge `name` (e.g. requests in flight) up or down by `delta`"""
+    with _lock:
+        _gauges[name] = _gauges.get(name, 0) + delta
+
+
+def gauges(prefix=''):
+    with _lock:
+        return {name: value for name, value in _gauges.items() if name.startswith(prefix)}
+
+
+def observe(name, value):
+    """Record a sample in the rolling window for `name`"""
+    with _lock:
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = deque(maxlen=METRICS_WINDOW_SIZE)
+        window.append(value)
+
+
+def counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def sample_count(name):
+    with _lock:
+        return len(_windows.get(name, ()))
+
+
+def percentile(name, pct):
+    """Nearest-rank percentile of the rolling window, or None when empty"""
+    with _lock:
+        samples = sorted(_windows.get(name, ()))
+    if not samples:
+        return None
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples))) - 1))
+    return samples[rank]
+
+
+def mean(name):
+    with _lock:
+        samples = list(_windows.get(name, ()))
+    if not samples:
+        return None
+    return sum(samples) / len(samples)
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        current = dict(_gauges)
+        windows = {name: list(window) for name, window in _windows.items()}
+
+    summaries = {}
+    for name, samples in windows.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        summaries[name] = {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p95': ordered[max(0, int(round(0.95 * len(ordered))) - 1)],
+            'max': ordered[-1]
+        }
+
+    return {
+        'counters': counters,
+        'gauges': current,
+        'windows': summaries
+    }
@@ -0,0 +1,183 @@
+"""Precompute /api/suggest-quick results for common combinations.
+
+    python precompute.py                      # walk data/precompute.json
+    python precompute.py --dry-run            # list the combinations only
+    python precompute.py --concurrency 2 --limit 100
+
+Walks every (city, weather category, temperature band, preference set) in the
+matrix, generates suggestions with the same prompt as /api/suggest-quick and
+writes them to the shared cache in batches, where the endpoint serves them for
+requests without a free-text query. Combinations whose key is already cached are
+skipped, so an interrupted or failed run resumes where it stopped and a run after
+the TTL regenerates whatever has expired. Calls run at bulk quota priority, so live traffic keeps its headroom; the job waits when the
+per-minute budget is spent and stops when the daily one is.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from cache import MemoryCache, get_cache
+from config import PRECOMPUTE_MATRIX_PATH, SUGGEST_PRECOMPUTE_TTL, SUGGEST_TEMPERATURE_BAND
+from quota import QuotaExceeded
+from routes.suggest import build_suggest_prompt, precompute_key
+from utils import call_gemini_streaming, geocode_search, extract_json
+
+
+def load_matrix(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def combinations(matrix, locations):
+    """Yield (key, location_name, category, condition, temperature, preferences) for every matrix cell"""
+    band_overrides = matrix.get('category_temperature_bands', {})
+    for city in matrix['cities']:
+        location_name = locations.get(city)
+        if not location_name:
+            continue
+        for category, condition in matrix['conditions'].items():
+            for band in band_overrides.get(category, matrix['temperature_bands']):
+                temperature = band + SUGGEST_TEMPERATURE_BAND / 2
+                for preferences in matrix['preference_sets']:
+                    key = precompute_key(location_name, category, temperature, preferences)
+                    yield key, location_name, category, condition, temperature, preferences
+
+
+def geocode_city(city):
+    """Geocode one matrix city, waiting out a spent per-minute quota; a spent daily quota is raised"""
+    while True:
+        try:
+            return geocode_search(city, language='ja', country='jp', count=1, route='suggest')
+        except QuotaExceeded as e:
+            if e.window != 'minute':
+                raise
+            time.sleep(e.retry_after)
+
+
+def resolve_cities(cities):
+    """Geocode matrix cities exactly as /api/suggest-quick does, so cache keys line up"""
+    locations = {}
+    for city in cities:
+        try:
+            results = geocode_city(city)
+        except requests.RequestException as e:
+            print(f'Skipping {city}: geocoding failed ({e})', file=sys.stderr)
+            continue
+        if results:
+            locations[city] = results[0]['name']
+        else:
+            print(f'Skipping {city}: no geocoding result', file=sys.stderr)
+    return locations
+
+
+def generate(location_name, condition, temperature, preferences, retries):
+    """Generate five suggestions, retrying failed or malformed responses.
+
+    A spent per-minute quota is waited out; a spent daily quota is raised.
+    """
+    prompt = build_suggest_prompt(location_name, condition, temperature, preferences, '')
+    attempt = 0
+    while True:
+        try:
+            suggestions = extract_json(call_gemini_streaming(prompt)).get('suggestions')
+            if isinstance(suggestions, list) and len(suggestions) >= 5:
+                return suggestions[:5]
+            error = f'{len(suggestions) if isinstance(suggestions, list) else 0} suggestions generated'
+        except QuotaExceeded as e:
+            if e.window != 'minute':
+                raise
+            time.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            error = str(e)
+        if attempt >= retries:
+            raise RuntimeError(error)
+        time.sleep(2 ** attempt)
+        attempt += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute quick suggestions for common combinations')
+    parser.add_argument('--matrix', default=PRECOMPUTE_MATRIX_PATH, help='combination matrix (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel generations (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=20, help='results per cache write (default: %(default)s)')
+    parser.add_argument('--retries', type=int, default=2, help='retries per combination (default: %(default)s)')
+    parser.add_argument('--limit', type=int, help='generate at most this many combinations')
+    parser.add_argument('--force', action='store_true', help='regenerate combinations that are already cached')
+    parser.add_argument('--dry-run', action='store_true', help='list pending combinations without generating')
+    args = parser.parse_args(argv)
+
+    if isinstance(get_cache(), MemoryCache):
+        print('The cache is in-process (CACHE_BACKEND=memory or the shared cache is unavailable), '
+              'so precomputed results would be lost when this job exits; '
+              'run it with the same shared or remote CACHE_BACKEND as the app', file=sys.stderr)
+        return 2
+
+    matrix = load_matrix(args.matrix)
+    try:
+        locations = resolve_cities(matrix['cities'])
+    except QuotaExceeded as e:
+        print(f'Stopped before generating: {e}; rerun in {e.retry_after}s', file=sys.stderr)
+        return 1
+    cells = list(combinations(matrix, locations))
+
+    pending = cells
+    if not args.force:
+        cached = get_cache().get_many(cell[0] for cell in cells)
+        pending = [cell for cell in cells if cell[0] not in cached]
+    print(f'{len(cells)} combinations, {len(cells) - len(pending)} already done, {len(pending)} to generate')
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    if args.dry_run:
+        for key, *_ in pending:
+            print(key)
+        return 0
+
+    batch = {}
+    written = 0
+    failed = []
+
+    def flush():
+        nonlocal written
+        if not batch:
+            return
+        get_cache().set_many(batch, SUGGEST_PRECOMPUTE_TTL)
+        written += len(batch)
+        batch.clear()
+
+    quota_error = None
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        jobs = {
+            pool.submit(generate, location_name, condition, temperature, preferences, args.retries): key
+            for key, location_name, category, condition, temperature, preferences in pending
+        }
+        for job in as_completed(jobs):
+            key = jobs[job]
+            if job.cancelled():
+                continue
+            try:
+                batch[key] = job.result()
+            except QuotaExceeded as e:
+                if quota_error is None:
+                    quota_error = e
+                    for other in jobs:
+                        other.cancel()
+                continue
+            except Exception as e:
+                failed.append(key)
+                print(f'Failed {key}: {e}', file=sys.stderr)
+                continue
+            if len(batch) >= args.batch_size:
+                flush()
+    flush()
+
+    print(f'{written} written, {len(failed)} failed')
+    if quota_error:
+        print(f'Stopped early: {quota_error}; rerun in {quota_error.retry_after}s to resume', file=sys.stderr)
+    return 1 if failed or quota_error else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
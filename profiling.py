@@ -0,0 +1,223 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from flask import g, request
+from config import PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL, PROFILE_DIR, PROFILE_MAX_FILES
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread every `interval` seconds from a helper thread"""
+
+    unit = 'milliseconds'
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        weight = self.interval * 1000
+        return {stack: count * weight for stack, count in self.stacks.items()}
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+class TracingProfiler:
+    """Deterministic profiler: attributes the exact time between profile events to the active stack"""
+
+    unit = 'microseconds'
+
+    def __init__(self):
+        self.stacks = {}
+        self._stack = []
+        self._last = None
+
+    def start(self):
+        frame = sys._getframe()
+        while frame is not None:
+            self._stack.insert(0, _frame_name(frame.f_code))
+            frame = frame.f_back
+        self._last = time.perf_counter()
+        sys.setprofile(self._event)
+
+    def stop(self):
+        sys.setprofile(None)
+        return self.stacks
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._stack:
+            stack = ';'.join(self._stack)
+            self.stacks[stack] = self.stacks.get(stack, 0) + (now - self._last) * 1e6
+
+        if event == 'call':
+            self._stack.append(_frame_name(frame.f_code))
+        elif event == 'c_call':
+            self._stack.append(f'{getattr(arg, "__qualname__", repr(arg))} (builtin)')
+        elif event in ('return', 'c_return', 'c_exception') and self._stack:
+            self._stack.pop()
+        self._last = time.perf_counter()
+
+
+def to_collapsed(profile):
+    """Brendan Gregg's collapsed-stack format, one `frame;frame;frame weight` line per stack"""
+    return ''.join(f'{stack} {max(1, round(weight))}\n' for stack, weight in profile['stacks'].items())
+
+
+def to_speedscope(profile):
+    """Convert a stored profile into a speedscope 'sampled' profile document"""
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, weight in profile['stacks'].items():
+        sample = []
+        for name in stack.split(';'):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            sample.append(index[name])
+        samples.append(sample)
+        weights.append(weight)
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': f'{profile["method"]} {profile["path"]}',
+        'exporter': 'ongaku-backend',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f'{profile["method"]} {profile["path"]} ({profile["mode"]})',
+            'unit': profile['unit'],
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }]
+    }
+
+
+def list_profiles():
+    """Metadata of stored profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith('.json'):
+            profile = load_profile(name[:-5])
+            if profile:
+                profile.pop('stacks')
+                profiles.append(profile)
+    return profiles
+
+
+def load_profile(profile_id):
+    path = os.path.join(PROFILE_DIR, f'{os.path.basename(profile_id)}.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(profile):
+    os.makedirs(PROFILE_DIR, mode=0o700, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{profile["id"]}.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(profile, f)
+    os.replace(path + '.tmp', path)
+
+    stored = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for name in stored[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def token_matches(value):
+    """Constant-time check of a header value against PROFILE_ADMIN_TOKEN"""
+    if not PROFILE_ADMIN_TOKEN or value is None:
+        return False
+    return hmac.compare_digest(value.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8'))
+
+
+def _start_profile():
+    requested = token_matches(request.headers.get('X-Profile'))
+    if not requested and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return
+
+    mode = request.headers.get('X-Profile-Mode', 'sampling') if requested else 'sampling'
+    profiler = TracingProfiler() if mode == 'trace' else SamplingProfiler()
+    g.profiler = profiler
+    g.profile_started = time.time()
+    profiler.start()
+
+
+def _finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+
+    stacks = profiler.stop()
+    started = g.pop('profile_started')
+    profile_id = f'{int(started * 1000)}-{uuid.uuid4().hex[:8]}'
+    _save({
+        'id': profile_id,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'mode': 'trace' if isinstance(profiler, TracingProfiler) else 'sampling',
+        'unit': profiler.unit,
+        'started_at': started,
+        'duration_ms': round((time.time() - started) * 1000, 2),
+        'stacks': stacks
+    })
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _abort_profile(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+def init_app(app):
+    """Install the profiling hooks, only when a token or sample rate is configured.
+
+    Register this before other after_request handlers so that their work
+    (e.g. compression) is included in the profile.
+    """
+    if not PROFILE_ADMIN_TOKEN and not PROFILE_SAMPLE_RATE:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abort_profile)
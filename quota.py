@@ -0,0 +1,96 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import has_request_context, request
+import metrics
+from cache import get_cache
+from config import QUOTA_ENABLED, QUOTA_LIMITS, QUOTA_SERVICES, QUOTA_PRIORITY_SHARES
+
+# Endpoints whose upstream calls may use the interactive share of each budget
+INTERACTIVE_ENDPOINTS = {'weather.weather', 'suggest.suggest_quick'}
+
+WINDOWS = (('minute', 60), ('day', 86400))
+
+_local = threading.local()
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of calling an upstream whose budget is used up for this priority"""
+
+    def __init__(self, budget, window, retry_after):
+        super().__init__(f'{budget} quota exhausted for this {window}')
+        self.budget = budget
+        self.window = window
+        self.retry_after = max(1, int(retry_after))
+
+
+def current_priority():
+    """Priority of the calling code: an explicit `priority()` scope, else the Flask endpoint.
+
+    Interactive endpoints get 'interactive', other requests 'standard' and
+    anything outside a request (batch jobs, prewarming) 'bulk'.
+    """
+    explicit = getattr(_local, 'priority', None)
+    if explicit:
+        return explicit
+    if not has_request_context():
+        return 'bulk'
+    return 'interactive' if request.endpoint in INTERACTIVE_ENDPOINTS else 'standard'
+
+
+@contextmanager
+def priority(name):
+    """Run the enclosed upstream calls at priority `name` (also used for worker threads)"""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = name
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def _window_key(budget, window, seconds, now):
+    return f'quota:{budget}:{window}:{int(now // seconds)}'
+
+
+def acquire(service, priority_name=None):
+    """Count one call to `service` against its budget, or raise QuotaExceeded.
+
+    Each budget has per-minute and per-day limits shared by every worker
+    through the cache backend; a call is refused once the window's usage
+    reaches the priority's share of the limit.
+    """
+    budget = QUOTA_SERVICES.get(service)
+    if not QUOTA_ENABLED or budget not in QUOTA_LIMITS:
+        return
+
+    priority_name = priority_name or current_priority()
+    share = QUOTA_PRIORITY_SHARES.get(priority_name, QUOTA_PRIORITY_SHARES['standard'])
+    cache = get_cache()
+    now = time.time()
+
+    counted = []
+    for (window, seconds), limit in zip(WINDOWS, QUOTA_LIMITS[budget]):
+        key = _window_key(budget, window, seconds, now)
+        used = cache.incr(key, 1, seconds * 2)
+        counted.append((key, seconds * 2))
+        if used > limit * share:
+            for done, ttl in counted:
+                cache.incr(done, -1, ttl)
+            metrics.incr(f'quota.{budget}.rejected.{priority_name}')
+            raise QuotaExceeded(budget, window, seconds - now % seconds)
+
+    metrics.incr(f'quota.{budget}.granted.{priority_name}')
+
+
+def usage():
+    """Current usage of every budget, per window, for health and metrics output"""
+    cache = get_cache()
+    now = time.time()
+    result = {}
+    for budget, limits in QUOTA_LIMITS.items():
+        result[budget] = {}
+        for (window, seconds), limit in zip(WINDOWS, limits):
+            used = cache.incr(_window_key(budget, window, seconds, now), 0, seconds * 2)
+            result[budget][window] = {'used': used, 'limit': limit}
+    return result
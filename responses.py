@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import time
+from functools import wraps
+from flask import request, make_response
+from flask.json.provider import DefaultJSONProvider
+import metrics
+from cache import get_cache
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson when it is installed"""
+
+    def _dump_bytes(self, obj, indent=False):
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                pass
+        return super().dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dump_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(
+            self._dump_bytes(obj, indent=indent) + b'\n',
+            mimetype=self.mimetype
+        )
+
+
+def _if_none_match(digest):
+    """Return the client's entity tag when it names any encoding of `digest`"""
+    for encoding in (None, *ENCODINGS):
+        etag = f'{digest}-{encoding}' if encoding else digest
+        if request.if_none_match.contains(etag):
+            return etag
+    return None
+
+
+def _not_modified(etag, max_age):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.vary.add('Accept-Encoding')
+    metrics.incr('http.not_modified')
+    return response
+
+
+def cacheable(max_age):
+    """Add a strong ETag and Cache-Control to successful responses of a view.
+
+    `max_age` is a number of seconds or a callable returning one. While a
+    response is fresh, a matching If-None-Match is answered with 304 before
+    the view runs, so nothing is fetched or serialized again.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = f'etag:{request.full_path}'
+            now = time.time()
+
+            validator = get_cache().get(key)
+            if validator and validator[1] > now:
+                etag = _if_none_match(validator[0])
+                if etag:
+                    return _not_modified(etag, int(validator[1] - now))
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            seconds = int(max_age() if callable(max_age) else max_age)
+            digest = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+
+            get_cache().set(key, (digest, now + seconds), seconds)
+
+            etag = _if_none_match(digest)
+            if etag:
+                return _not_modified(etag, seconds)
+
+            response.set_etag(digest)
+            response.headers['Cache-Control'] = f'public, max-age={seconds}'
+            return response
+        return wrapper
+    return decorator
+
+
+def compress_response(response):
+    """Compress JSON bodies above COMPRESSION_MIN_SIZE with the best accepted encoding"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if not encoding:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=min(COMPRESSION_LEVEL, 11))
+    else:
+        compressed = gzip.compress(body, compresslevel=min(COMPRESSION_LEVEL, 9))
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+
+    metrics.incr(f'http.compressed.{encoding}')
+    return response
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
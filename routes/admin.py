@@ -0,0 +1,35 @@
+from flask import Blueprint, request, jsonify, abort
+import profiling
+
+bp = Blueprint('admin', __name__)
+
+@bp.before_request
+def require_admin_token():
+    if not profiling.token_matches(request.headers.get('X-Admin-Token')):
+        abort(404)
+
+@bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify({'profiles': profiling.list_profiles()}), 200
+
+@bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    profile = profiling.load_profile(profile_id)
+    if not profile:
+        return jsonify({
+            'error': True,
+            'reason': f'Profile not found: {profile_id}'
+        }), 404
+
+    profile_format = request.args.get('format', 'speedscope')
+    if profile_format == 'collapsed':
+        return profiling.to_collapsed(profile), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    if profile_format == 'speedscope':
+        return jsonify(profiling.to_speedscope(profile)), 200
+    if profile_format == 'raw':
+        return jsonify(profile), 200
+
+    return jsonify({
+        'error': True,
+        'reason': 'Invalid format: use speedscope, collapsed or raw'
+    }), 400
@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify
 import requests
-from config import GEOCODING_API
+from config import GEOCODE_CACHE_MAX_AGE
+from quota import QuotaExceeded
+from responses import cacheable
+from utils import geocode_search
 
 bp = Blueprint('geocode', __name__)
 
 @bp.route('/api/geocode', methods=['GET'])
+@cacheable(GEOCODE_CACHE_MAX_AGE)
 def geocode():
     try:
         city_raw = request.args.get('city')
@@ -21,33 +25,15 @@ def geocode():
                 'reason': 'Missing required parameter: city'
             }), 400
 
-        params = {
-            'name': city,
-            'count': 5,
-            'language': language,
-            'format': 'json'
-        }
-
-        if country:
-            params['country'] = country
-
-        response = requests.get(GEOCODING_API, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        results = geocode_search(city, language=language, country=country, count=5, route='geocode')
 
-        if 'results' not in data or len(data['results']) == 0:
-            params.pop('country', None)
-            response = requests.get(GEOCODING_API, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-        if 'results' not in data or len(data['results']) == 0:
+        if not results:
             return jsonify({
                 'error': True,
                 'reason': f'No location found for: {city}'
             }), 404
 
-        top_result = data['results'][0]
+        top_result = results[0]
 
         result = {
             'success': True,
@@ -73,12 +59,17 @@ def geocode():
                     'admin1': loc.get('admin1'),
                     'country': loc.get('country')
                 }
-                for loc in data['results']
+                for loc in results
             ]
         }
 
         return jsonify(result), 200
 
+    except QuotaExceeded as e:
+        return jsonify({
+            'error': True,
+            'reason': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }), 503, {'Retry-After': str(e.retry_after)}
     except requests.exceptions.Timeout:
         return jsonify({
             'error': True,
@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify
 from datetime import datetime
+import load
+import metrics
+import quota
 
 bp = Blueprint('health', __name__)
 
@@ -11,9 +14,41 @@ def health():
         'version': '1.0.0',
         'endpoints': {
             'health': 'GET /health',
+            'ready': 'GET /ready',
+            'metrics': 'GET /metrics',
             'geocode': 'GET /api/geocode?city=<city_name>',
             'weather': 'GET /api/weather?city=<city> OR ?latitude=<lat>&longitude=<lon>',
             'suggest': 'POST /api/suggest-quick',
-            'itinerary': 'POST /api/itinerary'
+            'itinerary': 'POST /api/itinerary',
+            'itinerary_route': 'POST /api/itinerary/route',
+            'itinerary_update': 'PATCH /api/itinerary/<itinerary_id>',
+            'itinerary_refresh': 'POST /api/itinerary/<itinerary_id>/refresh'
         }
-    }), 200
\ No newline at end of file
+    }), 200
+
+@bp.route('/ready', methods=['GET'])
+def ready():
+    report = load.report()
+    report['timestamp'] = datetime.now().isoformat()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    snapshot = metrics.snapshot()
+    counters = snapshot['counters']
+    fired = counters.get('gemini.hedge.fired', 0)
+
+    return jsonify({
+        'timestamp': datetime.now().isoformat(),
+        'counters': counters,
+        'gauges': snapshot['gauges'],
+        'windows': snapshot['windows'],
+        'gemini_hedging': {
+            'calls': counters.get('gemini.calls', 0),
+            'fired': fired,
+            'won': counters.get('gemini.hedge.won', 0),
+            'suppressed': counters.get('gemini.hedge.suppressed', 0),
+            'win_rate': counters.get('gemini.hedge.won', 0) / fired if fired else None
+        },
+        'quota': quota.usage()
+    }), 200
@@ -1,259 +1,89 @@
 from flask import Blueprint, request, jsonify
 import requests
 import json
-import re
 import traceback
+import uuid
 from datetime import datetime, timedelta
-from config import GEOCODING_API, WEATHER_API, WEATHER_CONDITIONS, GEMINI_API_KEY
-from utils import call_gemini_streaming
+from cache import get_store
+from config import WEATHER_CONDITIONS, GEMINI_API_KEY, ITINERARY_TTL, PRECIPITATION_THRESHOLD, ROUTE_MAX_LEGS
+from forecast import fetch_forecast
+from quota import QuotaExceeded, current_priority, priority as quota_priority
+from utils import call_gemini_streaming, geocode_search, extract_json, weather_category, executor, llm_executor, parse_coordinates
 
 bp = Blueprint('itinerary', __name__)
 
-@bp.route('/api/itinerary', methods=['POST'])
-def create_itinerary():
-    try:
-        if not GEMINI_API_KEY:
-            return jsonify({
-                'error': True,
-                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
-            }), 500
-        
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'error': True,
-                'reason': 'Request body must be JSON'
-            }), 400
-        
-        location = data.get('location')
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
-        target_date = data.get('date')
-        duration_days = data.get('duration_days', 1)
-        preferences = data.get('preferences', [])
-        user_query = data.get('user_query', '')
-        language = data.get('language', 'ja').lower()
-        
-        if language not in ['ja', 'en']:
-            language = 'ja'
-        
-        try:
-            duration_days = int(duration_days)
-            if duration_days < 1:
-                duration_days = 1
-            elif duration_days > 7:
-                duration_days = 7
-        except (ValueError, TypeError):
-            duration_days = 1
-        
-        if not location and (not latitude or not longitude):
-            error_msg = {
-                'ja': 'location または (latitude と longitude) が必要です',
-                'en': 'Either location OR (latitude AND longitude) is required'
-            }
-            return jsonify({
-                'error': True,
-                'reason': error_msg[language],
-                'received_data': {
-                    'location': location,
-                    'latitude': latitude,
-                    'longitude': longitude
-                }
-            }), 400
-        
-        if not latitude or not longitude:
-            geocode_params = {
-                'name': location,
-                'count': 1,
-                'language': language,
-                'country': 'jp'
-            }
-            
-            try:
-                geo_response = requests.get(GEOCODING_API, params=geocode_params, timeout=10)
-                geo_response.raise_for_status()
-                geo_data = geo_response.json()
-                
-                if 'results' not in geo_data or len(geo_data['results']) == 0:
-                    error_msg = {
-                        'ja': f'場所が見つかりません: {location}。Tokyo、Osaka、Kyotoなどの英語の都市名を試してください',
-                        'en': f'Could not find location: {location}. Try using city names like Tokyo, Osaka, or Kyoto'
-                    }
-                    return jsonify({
-                        'error': True,
-                        'reason': error_msg[language]
-                    }), 404
-                
-                result = geo_data['results'][0]
-                latitude = result['latitude']
-                longitude = result['longitude']
-                location_name = result['name']
-                admin1 = result.get('admin1', '')
-                
-            except requests.exceptions.RequestException as e:
-                error_msg = {
-                    'ja': f'ジオコーディングに失敗しました: {str(e)}',
-                    'en': f'Geocoding failed: {str(e)}'
-                }
-                return jsonify({
-                    'error': True,
-                    'reason': error_msg[language]
-                }), 500
-        else:
-            location_name = location if location else f"Location ({latitude}, {longitude})"
-            admin1 = ''
+# Day fields set by the server rather than the LLM; a regenerated day keeps them from the day it replaces
+SERVER_DAY_FIELDS = ('day', 'date', 'leg', 'location')
+
+def group_daily_weather(hourly):
+    """Group Open-Meteo hourly data into per-date lists of hour entries"""
+    times = hourly.get('time', [])
+    temps = hourly.get('temperature_2m', [])
+    precip = hourly.get('precipitation', [])
+    codes = hourly.get('weathercode', [])
+    
+    daily_weather = {}
+    for i in range(len(times)):
+        date_key = times[i].split('T')[0]
+        if date_key not in daily_weather:
+            daily_weather[date_key] = []
+        daily_weather[date_key].append({
+            'time': times[i],
+            'temperature': temps[i],
+            'precipitation': precip[i],
+            'weathercode': codes[i],
+            'condition': WEATHER_CONDITIONS.get(codes[i], 'Unknown')
+        })
+    return daily_weather
+
+def summarize_days(daily_weather):
+    """Pick morning (09:00), afternoon (14:00) and evening (18:00) weather for each date"""
+    daily_summaries = []
+    for date_key in sorted(daily_weather.keys()):
+        hours = daily_weather[date_key]
         
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        morning = next((h for h in hours if '09:00' in h['time']), hours[0] if hours else None)
+        afternoon = next((h for h in hours if '14:00' in h['time']), hours[len(hours)//2] if hours else None)
+        evening = next((h for h in hours if '18:00' in h['time']), hours[-1] if hours else None)
         
-        if target_date:
-            try:
-                start_dt = datetime.strptime(target_date, '%Y-%m-%d')
-                days_ahead = (start_dt.date() - today.date()).days
-                
-                if days_ahead < 0:
-                    error_msg = {
-                        'ja': f'過去の日付は計画できません。日付 {target_date} は過去です。',
-                        'en': f'Cannot plan for past dates. Date {target_date} is in the past.'
-                    }
-                    return jsonify({
-                        'error': True,
-                        'reason': error_msg[language],
-                        'today': today.strftime('%Y-%m-%d')
-                    }), 400
-                
-                if days_ahead > 7:
-                    error_msg = {
-                        'ja': f'天気予報は7日先までしか利用できません。',
-                        'en': f'Weather forecast only available up to 7 days ahead.'
-                    }
-                    return jsonify({
-                        'error': True,
-                        'reason': error_msg[language],
-                        'requested_date': target_date,
-                        'max_date': (today + timedelta(days=7)).strftime('%Y-%m-%d')
-                    }), 400
-                    
-            except ValueError as e:
-                error_msg = {
-                    'ja': f'無効な日付形式: {target_date}。YYYY-MM-DD形式を使用してください（例：2025-10-12）',
-                    'en': f'Invalid date format: {target_date}. Use YYYY-MM-DD format (e.g., 2025-10-12)'
+        if morning and afternoon and evening:
+            daily_summaries.append({
+                'date': date_key,
+                'morning': {
+                    'condition': morning['condition'],
+                    'temperature': morning['temperature'],
+                    'precipitation': morning['precipitation']
+                },
+                'afternoon': {
+                    'condition': afternoon['condition'],
+                    'temperature': afternoon['temperature'],
+                    'precipitation': afternoon['precipitation']
+                },
+                'evening': {
+                    'condition': evening['condition'],
+                    'temperature': evening['temperature'],
+                    'precipitation': evening['precipitation']
                 }
-                return jsonify({
-                    'error': True,
-                    'reason': error_msg[language]
-                }), 400
-        else:
-            start_dt = today
-            target_date = start_dt.strftime('%Y-%m-%d')
-        
-        end_dt = start_dt + timedelta(days=duration_days - 1)
-        end_date = end_dt.strftime('%Y-%m-%d')
-        
-        weather_params = {
-            'latitude': latitude,
-            'longitude': longitude,
-            'hourly': 'temperature_2m,precipitation,weathercode,windspeed_10m,relativehumidity_2m',
-            'current_weather': 'true',
-            'timezone': 'Asia/Tokyo',
-            'start_date': target_date,
-            'end_date': end_date
-        }
-        
-        try:
-            weather_response = requests.get(WEATHER_API, params=weather_params, timeout=10)
-            weather_response.raise_for_status()
-            weather_data = weather_response.json()
-        except requests.exceptions.RequestException as e:
-            error_msg = {
-                'ja': f'天気APIに失敗しました: {str(e)}',
-                'en': f'Weather API failed: {str(e)}'
-            }
-            return jsonify({
-                'error': True,
-                'reason': error_msg[language]
-            }), 500
-        
-        hourly = weather_data.get('hourly', {})
-        times = hourly.get('time', [])
-        temps = hourly.get('temperature_2m', [])
-        precip = hourly.get('precipitation', [])
-        codes = hourly.get('weathercode', [])
-        
-        if not times or len(times) == 0:
-            error_msg = {
-                'ja': 'リクエストされた日付範囲の天気データが利用できません',
-                'en': 'No weather data available for the requested date range'
-            }
-            return jsonify({
-                'error': True,
-                'reason': error_msg[language]
-            }), 500
-        
-        daily_weather = {}
-        for i in range(len(times)):
-            date_key = times[i].split('T')[0]
-            if date_key not in daily_weather:
-                daily_weather[date_key] = []
-            daily_weather[date_key].append({
-                'time': times[i],
-                'temperature': temps[i],
-                'precipitation': precip[i],
-                'weathercode': codes[i],
-                'condition': WEATHER_CONDITIONS.get(codes[i], 'Unknown')
             })
-        
-        daily_summaries = []
-        for date_key in sorted(daily_weather.keys()):
-            hours = daily_weather[date_key]
-            
-            morning = next((h for h in hours if '09:00' in h['time']), hours[0] if hours else None)
-            afternoon = next((h for h in hours if '14:00' in h['time']), hours[len(hours)//2] if hours else None)
-            evening = next((h for h in hours if '18:00' in h['time']), hours[-1] if hours else None)
-            
-            if morning and afternoon and evening:
-                daily_summaries.append({
-                    'date': date_key,
-                    'morning': {
-                        'condition': morning['condition'],
-                        'temperature': morning['temperature'],
-                        'precipitation': morning['precipitation']
-                    },
-                    'afternoon': {
-                        'condition': afternoon['condition'],
-                        'temperature': afternoon['temperature'],
-                        'precipitation': afternoon['precipitation']
-                    },
-                    'evening': {
-                        'condition': evening['condition'],
-                        'temperature': evening['temperature'],
-                        'precipitation': evening['precipitation']
-                    }
-                })
-        
-        if not daily_summaries:
-            error_msg = {
-                'ja': '旅程計画のための天気データを解析できませんでした',
-                'en': 'Could not parse weather data for itinerary planning'
-            }
-            return jsonify({
-                'error': True,
-                'reason': error_msg[language]
-            }), 500
-        
-        weather_summary = "\n".join([
-            f"Day {i+1} ({ds['date']}): "
-            f"Morning {ds['morning']['condition']} {ds['morning']['temperature']:.1f}°C, "
-            f"Afternoon {ds['afternoon']['condition']} {ds['afternoon']['temperature']:.1f}°C, "
-            f"Evening {ds['evening']['condition']} {ds['evening']['temperature']:.1f}°C"
-            for i, ds in enumerate(daily_summaries)
-        ])
-        
-        day_names_ja = ['月曜日', '火曜日', '水曜日', '木曜日', '金曜日', '土曜日', '日曜日']
-        day_names_en = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
-        if language == 'ja':
-            prompt = f"""あなたは{location_name}の音楽専門の地元ガイドです。{location_name}での詳細な旅程を作成してください。
+    return daily_summaries
+
+def format_weather_summary(daily_summaries, first_day=1):
+    return "\n".join([
+        f"Day {i+first_day} ({ds['date']}): "
+        f"Morning {ds['morning']['condition']} {ds['morning']['temperature']:.1f}°C, "
+        f"Afternoon {ds['afternoon']['condition']} {ds['afternoon']['temperature']:.1f}°C, "
+        f"Evening {ds['evening']['condition']} {ds['evening']['temperature']:.1f}°C"
+        for i, ds in enumerate(daily_summaries)
+    ])
+
+def build_itinerary_prompt(language, location_name, admin1, target_date, start_dt,
+                           duration_days, preferences, user_query, weather_summary):
+    """Build the full itinerary generation prompt in the requested language"""
+    day_names_ja = ['月曜日', '火曜日', '水曜日', '木曜日', '金曜日', '土曜日', '日曜日']
+    day_names_en = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    
+    if language == 'ja':
+        return f"""あなたは{location_name}の音楽専門の地元ガイドです。{location_name}での詳細な旅程を作成してください。
 
 重要な場所の制約:
 - すべての活動は{location_name}または5km圏内にある必要があります
@@ -335,9 +165,9 @@ def create_itinerary():
 }}
 
 {duration_days}日分を含めてください。各日は{location_name}での4〜6の活動を含みます。"""
-        
-        else:
-            prompt = f"""You are a local music guide for {location_name}, Japan. Create a detailed itinerary for {location_name}.
+    
+    else:
+        return f"""You are a local music guide for {location_name}, Japan. Create a detailed itinerary for {location_name}.
 
 CRITICAL LOCATION REQUIREMENTS:
 - ALL activities must be in {location_name} or within 5km radius
@@ -419,51 +249,458 @@ Return ONLY valid JSON (no markdown). Fill Japanese fields in Japanese and Engli
 }}
 
 Include {duration_days} day(s), each with 4-6 activities in {location_name}."""
+
+def fetch_daily_summaries(latitude, longitude, start_date, end_date):
+    weather_data = fetch_forecast(
+        latitude,
+        longitude,
+        'Asia/Tokyo',
+        hourly=('temperature_2m', 'precipitation', 'weathercode'),
+        hours=(9, 14, 18),
+        start_date=start_date,
+        end_date=end_date
+    )
+    return summarize_days(group_daily_weather(weather_data.get('hourly', {})))
+
+def fetch_leg_summaries(legs, start_date, priority):
+    """Daily summaries from `start_date` on for each leg (latitude, longitude, start/end dates), fetched concurrently"""
+    def fetch(leg):
+        with quota_priority(priority):
+            return fetch_daily_summaries(
+                leg['latitude'], leg['longitude'], max(leg['start_date'], start_date), leg['end_date']
+            )
+    
+    if len(legs) == 1:
+        return [fetch(legs[0])]
+    return list(executor.map(fetch, legs))
+
+class LocationNotFound(Exception):
+    """Raised by prepare_leg when a leg's location has no geocoding result"""
+
+def prepare_leg(leg, language, priority):
+    """Geocode a route leg when it has no coordinates, then fetch its daily weather summaries"""
+    with quota_priority(priority):
+        if leg['latitude'] is None:
+            geo_results = geocode_search(leg['location'], language=language, country='jp', count=1, route='itinerary')
+            if not geo_results:
+                raise LocationNotFound(leg['location'])
+            result = geo_results[0]
+            leg = dict(
+                leg,
+                location=result['name'],
+                prefecture=result.get('admin1', ''),
+                latitude=result['latitude'],
+                longitude=result['longitude']
+            )
         
-        try:
-            itinerary_response = call_gemini_streaming(prompt)
-        except Exception as e:
-            error_msg = {
-                'ja': f'LLM生成に失敗しました: {str(e)}',
-                'en': f'LLM generation failed: {str(e)}'
-            }
+        summaries = fetch_daily_summaries(leg['latitude'], leg['longitude'], leg['start_date'], leg['end_date'])
+    return leg, summaries
+
+def format_route_context(language, legs, index):
+    """Tell the generator where a leg sits in the trip, so arrival and departure days are planned sensibly"""
+    route = ' → '.join(leg['location'] for leg in legs)
+    previous = legs[index - 1]['location'] if index > 0 else None
+    following = legs[index + 1]['location'] if index + 1 < len(legs) else None
+    
+    if language == 'ja':
+        notes = [f'複数都市の旅程（{route}）の{index + 1}区間目です。']
+        if previous:
+            notes.append(f'初日は{previous}から移動してくるので、午前中は軽めにしてください。')
+        if following:
+            notes.append(f'最終日の夜は{following}へ移動するので、遅い時間の予定は入れないでください。')
+        return ''.join(notes)
+    
+    notes = [f'This is leg {index + 1} of a multi-city trip ({route}).']
+    if previous:
+        notes.append(f'The traveler arrives from {previous} on the first day, so keep that morning light.')
+    if following:
+        notes.append(f'They travel on to {following} on the evening of the last day, so avoid late activities.')
+    return ' '.join(notes)
+
+def slot_changes(old_summary, new_summary):
+    """Slots whose weather category or wet/dry state differs between two daily summaries"""
+    changed = []
+    for slot in ('morning', 'afternoon', 'evening'):
+        old, new = old_summary[slot], new_summary[slot]
+        was_wet = (old['precipitation'] or 0) >= PRECIPITATION_THRESHOLD
+        is_wet = (new['precipitation'] or 0) >= PRECIPITATION_THRESHOLD
+        if weather_category(old['condition']) != weather_category(new['condition']) or was_wet != is_wet:
+            changed.append(slot)
+    return changed
+
+def _plan_outline(days, skip_index=None):
+    """One line per day listing its activities, used as context for partial regeneration"""
+    lines = []
+    for i, day in enumerate(days):
+        if i == skip_index:
+            continue
+        activities = '; '.join(
+            f"{item.get('time_slot', '')} {item.get('activity_en') or item.get('activity', '')} @ "
+            f"{item.get('location_en') or item.get('location', '')}"
+            for item in day.get('schedule', [])
+        )
+        lines.append(f"Day {day.get('day', i + 1)} ({day.get('date', '')}): {activities}")
+    return "\n".join(lines)
+
+def _plan_date(stored, day_index):
+    """Calendar date of a day of a stored plan.
+
+    Route itineraries stamp each day's date at creation; single-city plans run
+    day by day from the start date, which also covers plans stored before their
+    dates were stamped.
+    """
+    if stored.get('legs'):
+        return stored['itinerary'][day_index].get('date')
+    start = datetime.strptime(stored['query']['start_date'], '%Y-%m-%d')
+    return (start + timedelta(days=day_index)).strftime('%Y-%m-%d')
+
+def _day_weather(stored, day_index, day_number):
+    date = _plan_date(stored, day_index)
+    summaries = [ds for ds in stored['weather_summary'] if ds['date'] == date]
+    return format_weather_summary(summaries, first_day=day_number) if summaries else 'Unknown'
+
+def _day_place(stored, day_plan):
+    """City and prefecture of one day; multi-city itineraries record the leg of each day"""
+    if stored.get('legs') and day_plan.get('leg') is not None:
+        leg = stored['legs'][day_plan['leg']]
+        return leg['location'], leg['prefecture']
+    return stored['query']['location'], stored['query']['prefecture']
+
+def _replacement_day(old_day, replacement):
+    """Carry the server-owned fields of a day over to the LLM-generated day replacing it"""
+    for field in SERVER_DAY_FIELDS:
+        if field in old_day:
+            replacement[field] = old_day[field]
+    return replacement
+
+def build_day_prompt(stored, day_index, preferences, user_query):
+    """Prompt that regenerates one day of a stored itinerary, keeping the other days as context"""
+    query = stored['query']
+    days = stored['itinerary']
+    day_plan = days[day_index]
+    location_name, prefecture = _day_place(stored, day_plan)
+    day_number = day_plan.get('day', day_index + 1)
+    weather = _day_weather(stored, day_index, day_number)
+    outline = _plan_outline(days, skip_index=day_index) or 'None'
+    example = json.dumps({'day': day_plan}, ensure_ascii=False, indent=2)
+    
+    if query['language'] == 'ja':
+        return f"""あなたは{location_name}の音楽専門の地元ガイドです。既存の旅程のDay {day_number}（{day_plan.get('date')}）だけを作り直してください。
+
+場所: {location_name}（{prefecture}）
+好み: {', '.join(preferences) if preferences else 'なし'}
+変更の要望: {user_query or 'より良い代替案'}
+
+この日の天気:
+{weather}
+
+他の日の予定（重複を避けてください）:
+{outline}
+
+すべての活動は{location_name}または5km圏内の実在の会場にしてください。雨の時は屋内、良い天気の時は屋外の活動を予定してください。
+
+有効なJSONのみを返してください（マークダウンなし）。現在の日と全く同じJSON構造で、4〜6の活動を含めてください:
+
+{example}"""
+    
+    return f"""You are a local music guide for {location_name}, Japan. Regenerate ONLY Day {day_number} ({day_plan.get('date')}) of an existing itinerary.
+
+Location: {location_name} ({prefecture})
+Preferences: {', '.join(preferences) if preferences else 'None'}
+Requested change: {user_query or 'A better alternative plan'}
+
+Weather for this day:
+{weather}
+
+Other days of the plan (do not repeat these):
+{outline}
+
+ALL activities must be at REAL venues in {location_name} or within 5km. Schedule indoor activities during rain and outdoor activities during good weather.
+
+Return ONLY valid JSON (no markdown) with exactly the same structure as the current day, with 4-6 activities. Fill Japanese fields in Japanese and English fields in English:
+
+{example}"""
+
+def build_slot_prompt(stored, day_index, slot_index, preferences, user_query):
+    """Prompt that regenerates a single schedule entry of a stored itinerary"""
+    query = stored['query']
+    day_plan = stored['itinerary'][day_index]
+    location_name, prefecture = _day_place(stored, day_plan)
+    day_number = day_plan.get('day', day_index + 1)
+    schedule = day_plan.get('schedule', [])
+    current = schedule[slot_index]
+    weather = _day_weather(stored, day_index, day_number)
+    rest_of_day = _plan_outline([{
+        'day': day_number,
+        'date': day_plan.get('date'),
+        'schedule': [item for i, item in enumerate(schedule) if i != slot_index]
+    }])
+    example = json.dumps({'schedule_item': current}, ensure_ascii=False, indent=2)
+    
+    if query['language'] == 'ja':
+        return f"""あなたは{location_name}の音楽専門の地元ガイドです。Day {day_number}（{day_plan.get('date')}）の {current.get('time_slot', '')} の予定1件だけを別の活動に置き換えてください。
+
+場所: {location_name}（{prefecture}）
+好み: {', '.join(preferences) if preferences else 'なし'}
+変更の要望: {user_query or 'より良い代替案'}
+
+この日の天気:
+{weather}
+
+この日の他の予定（変更しないでください）:
+{rest_of_day}
+
+時間帯は同じにし、{location_name}の実在の会場を使用してください。
+
+有効なJSONのみを返してください（マークダウンなし）。現在の予定と全く同じJSON構造で:
+
+{example}"""
+    
+    return f"""You are a local music guide for {location_name}, Japan. Replace ONLY the {current.get('time_slot', '')} entry of Day {day_number} ({day_plan.get('date')}) with a different activity.
+
+Location: {location_name} ({prefecture})
+Preferences: {', '.join(preferences) if preferences else 'None'}
+Requested change: {user_query or 'A better alternative'}
+
+Weather for this day:
+{weather}
+
+Rest of this day (keep unchanged, do not repeat):
+{rest_of_day}
+
+Keep the same time slot and use a REAL venue in {location_name}.
+
+Return ONLY valid JSON (no markdown) with exactly the same structure as the current entry. Fill Japanese fields in Japanese and English fields in English:
+
+{example}"""
+
+@bp.route('/api/itinerary', methods=['POST'])
+def create_itinerary():
+    try:
+        if not GEMINI_API_KEY:
             return jsonify({
                 'error': True,
-                'reason': error_msg[language]
+                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
             }), 500
         
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'error': True,
+                'reason': 'Request body must be JSON'
+            }), 400
+        
+        location = data.get('location')
+        latitude = data.get('latitude')
+        longitude = data.get('longitude')
+        target_date = data.get('date')
+        duration_days = data.get('duration_days', 1)
+        preferences = data.get('preferences', [])
+        user_query = data.get('user_query', '')
+        language = data.get('language', 'ja').lower()
+        
+        if language not in ['ja', 'en']:
+            language = 'ja'
+        
         try:
-            itinerary_text = itinerary_response.strip()
-            
-            if itinerary_text.startswith('```'):
-                parts = itinerary_text.split('```')
-                if len(parts) >= 3:
-                    itinerary_text = parts[1]
-                    if itinerary_text.startswith('json'):
-                        itinerary_text = itinerary_text[4:].strip()
-            
-            if not itinerary_text.startswith('{'):
-                json_match = re.search(r'\{.*\}', itinerary_text, re.DOTALL)
-                if json_match:
-                    itinerary_text = json_match.group(0)
-            
-            itinerary_json = json.loads(itinerary_text)
-            
-            if 'itinerary' not in itinerary_json:
-                error_msg = {
-                    'ja': '無効な応答: "itinerary"フィールドがありません',
-                    'en': 'Invalid response: missing "itinerary" field'
-                }
+            duration_days = int(duration_days)
+            if duration_days < 1:
+                duration_days = 1
+            elif duration_days > 7:
+                duration_days = 7
+        except (ValueError, TypeError):
+            duration_days = 1
+        
+        if not location and (not latitude or not longitude):
+            error_msg = {
+                'ja': 'location または (latitude と longitude) が必要です',
+                'en': 'Either location OR (latitude AND longitude) is required'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language],
+                'received_data': {
+                    'location': location,
+                    'latitude': latitude,
+                    'longitude': longitude
+                }
+            }), 400
+        
+        if not latitude or not longitude:
+            try:
+                geo_results = geocode_search(location, language=language, country='jp', count=1, route='itinerary')
+                
+                if not geo_results:
+                    error_msg = {
+                        'ja': f'場所が見つかりません: {location}。Tokyo、Osaka、Kyotoなどの英語の都市名を試してください',
+                        'en': f'Could not find location: {location}. Try using city names like Tokyo, Osaka, or Kyoto'
+                    }
+                    return jsonify({
+                        'error': True,
+                        'reason': error_msg[language]
+                    }), 404
+                
+                result = geo_results[0]
+                latitude = result['latitude']
+                longitude = result['longitude']
+                location_name = result['name']
+                admin1 = result.get('admin1', '')
+                
+            except requests.exceptions.RequestException as e:
+                error_msg = {
+                    'ja': f'ジオコーディングに失敗しました: {str(e)}',
+                    'en': f'Geocoding failed: {str(e)}'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 500
+        else:
+            try:
+                latitude, longitude = parse_coordinates(latitude, longitude)
+            except ValueError:
+                error_msg = {
+                    'ja': 'latitude と longitude は -90〜90 と -180〜180 の範囲の数値で指定してください',
+                    'en': 'latitude and longitude must be numbers within -90..90 and -180..180'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+            location_name = location if location else f"Location ({latitude}, {longitude})"
+            admin1 = ''
+        
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        if target_date:
+            try:
+                start_dt = datetime.strptime(target_date, '%Y-%m-%d')
+                days_ahead = (start_dt.date() - today.date()).days
+                
+                if days_ahead < 0:
+                    error_msg = {
+                        'ja': f'過去の日付は計画できません。日付 {target_date} は過去です。',
+                        'en': f'Cannot plan for past dates. Date {target_date} is in the past.'
+                    }
+                    return jsonify({
+                        'error': True,
+                        'reason': error_msg[language],
+                        'today': today.strftime('%Y-%m-%d')
+                    }), 400
+                
+                if days_ahead > 7:
+                    error_msg = {
+                        'ja': f'天気予報は7日先までしか利用できません。',
+                        'en': f'Weather forecast only available up to 7 days ahead.'
+                    }
+                    return jsonify({
+                        'error': True,
+                        'reason': error_msg[language],
+                        'requested_date': target_date,
+                        'max_date': (today + timedelta(days=7)).strftime('%Y-%m-%d')
+                    }), 400
+                    
+            except ValueError as e:
+                error_msg = {
+                    'ja': f'無効な日付形式: {target_date}。YYYY-MM-DD形式を使用してください（例：2025-10-12）',
+                    'en': f'Invalid date format: {target_date}. Use YYYY-MM-DD format (e.g., 2025-10-12)'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+        else:
+            start_dt = today
+            target_date = start_dt.strftime('%Y-%m-%d')
+        
+        end_dt = start_dt + timedelta(days=duration_days - 1)
+        end_date = end_dt.strftime('%Y-%m-%d')
+        
+        try:
+            weather_data = fetch_forecast(
+                latitude,
+                longitude,
+                'Asia/Tokyo',
+                hourly=('temperature_2m', 'precipitation', 'weathercode'),
+                hours=(9, 14, 18),
+                start_date=target_date,
+                end_date=end_date
+            )
+        except requests.exceptions.RequestException as e:
+            error_msg = {
+                'ja': f'天気APIに失敗しました: {str(e)}',
+                'en': f'Weather API failed: {str(e)}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        hourly = weather_data.get('hourly', {})
+        
+        if not hourly.get('time'):
+            error_msg = {
+                'ja': 'リクエストされた日付範囲の天気データが利用できません',
+                'en': 'No weather data available for the requested date range'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        daily_summaries = summarize_days(group_daily_weather(hourly))
+        
+        if not daily_summaries:
+            error_msg = {
+                'ja': '旅程計画のための天気データを解析できませんでした',
+                'en': 'Could not parse weather data for itinerary planning'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        weather_summary = format_weather_summary(daily_summaries)
+        
+        prompt = build_itinerary_prompt(
+            language, location_name, admin1, target_date, start_dt,
+            duration_days, preferences, user_query, weather_summary
+        )
+        
+        try:
+            itinerary_response = call_gemini_streaming(prompt)
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            error_msg = {
+                'ja': f'LLM生成に失敗しました: {str(e)}',
+                'en': f'LLM generation failed: {str(e)}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        try:
+            itinerary_json = extract_json(itinerary_response)
+            
+            if 'itinerary' not in itinerary_json:
+                error_msg = {
+                    'ja': '無効な応答: "itinerary"フィールドがありません',
+                    'en': 'Invalid response: missing "itinerary" field'
+                }
                 return jsonify({
                     'error': True,
                     'reason': error_msg[language],
                     'raw_response_preview': itinerary_response[:1000]
                 }), 500
             
-            if not isinstance(itinerary_json['itinerary'], list) or len(itinerary_json['itinerary']) == 0:
+            days = itinerary_json['itinerary']
+            if not isinstance(days, list) or not days or not all(isinstance(d, dict) for d in days):
                 error_msg = {
-                    'ja': '無効な応答: itineraryが空またはリストではありません',
-                    'en': 'Invalid response: itinerary is empty or not a list'
+                    'ja': '無効な応答: itineraryが空または日のリストではありません',
+                    'en': 'Invalid response: itinerary is empty or not a list of days'
                 }
                 return jsonify({
                     'error': True,
@@ -483,8 +720,16 @@ Include {duration_days} day(s), each with 4-6 activities in {location_name}."""
                 'raw_response_preview': itinerary_response[:2000]
             }), 500
         
+        # Day numbers and dates are server-owned: refresh and PATCH match days to forecasts by them
+        itinerary = itinerary_json['itinerary'][:duration_days]
+        for offset, day_plan in enumerate(itinerary):
+            day_plan['day'] = offset + 1
+            day_plan['date'] = (start_dt + timedelta(days=offset)).strftime('%Y-%m-%d')
+        
+        itinerary_id = uuid.uuid4().hex
         result = {
             'success': True,
+            'itinerary_id': itinerary_id,
             'query': {
                 'location': location_name,
                 'prefecture': admin1,
@@ -498,10 +743,12 @@ Include {duration_days} day(s), each with 4-6 activities in {location_name}."""
                 'language': language
             },
             'weather_summary': daily_summaries,
-            'itinerary': itinerary_json['itinerary'],
+            'itinerary': itinerary,
             'llm_provider': 'gemini'
         }
         
+        get_store().set(f'itinerary:{itinerary_id}', result, ITINERARY_TTL)
+        
         return jsonify(result), 200
         
     except requests.exceptions.Timeout:
@@ -513,6 +760,15 @@ Include {duration_days} day(s), each with 4-6 activities in {location_name}."""
             'error': True,
             'reason': error_msg.get(language, error_msg['en'])
         }), 504
+    except QuotaExceeded as e:
+        error_msg = {
+            'ja': f'外部APIの利用上限に達しました。{e.retry_after}秒後に再試行してください',
+            'en': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en'])
+        }), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         error_msg = {
             'ja': f'内部サーバーエラー: {str(e)}',
@@ -523,4 +779,529 @@ Include {duration_days} day(s), each with 4-6 activities in {location_name}."""
             'reason': error_msg.get(language, error_msg['en']),
             'error_type': type(e).__name__,
             'traceback': traceback.format_exc()
-        }), 500
\ No newline at end of file
+        }), 500
+
+@bp.route('/api/itinerary/route', methods=['POST'])
+def create_route_itinerary():
+    language = 'ja'
+    try:
+        if not GEMINI_API_KEY:
+            return jsonify({
+                'error': True,
+                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
+            }), 500
+        
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'error': True,
+                'reason': 'Request body must be JSON'
+            }), 400
+        
+        legs_raw = data.get('legs')
+        preferences = data.get('preferences', [])
+        user_query = data.get('user_query', '')
+        language = str(data.get('language', 'ja')).lower()
+        
+        if language not in ['ja', 'en']:
+            language = 'ja'
+        
+        if not isinstance(legs_raw, list) or not 1 <= len(legs_raw) <= ROUTE_MAX_LEGS:
+            error_msg = {
+                'ja': f'legs には1〜{ROUTE_MAX_LEGS}件の区間を指定してください',
+                'en': f'legs must be a list of 1 to {ROUTE_MAX_LEGS} route legs'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 400
+        
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        next_start = today
+        legs = []
+        for i, leg_raw in enumerate(legs_raw):
+            leg_raw = leg_raw if isinstance(leg_raw, dict) else {}
+            location = leg_raw.get('location')
+            latitude = leg_raw.get('latitude')
+            longitude = leg_raw.get('longitude')
+            
+            has_coordinates = latitude is not None and longitude is not None
+            if not location and not has_coordinates:
+                error_msg = {
+                    'ja': f'区間{i + 1}: location または (latitude と longitude) が必要です',
+                    'en': f'Leg {i + 1}: either location OR (latitude AND longitude) is required'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+            
+            try:
+                duration_days = max(1, int(leg_raw.get('duration_days', 1)))
+                start_dt = datetime.strptime(leg_raw['date'], '%Y-%m-%d') if leg_raw.get('date') else next_start
+                if has_coordinates:
+                    latitude, longitude = parse_coordinates(latitude, longitude)
+            except (ValueError, TypeError):
+                error_msg = {
+                    'ja': f'区間{i + 1}: 日付、日数または座標が無効です。日付はYYYY-MM-DD形式で指定してください',
+                    'en': f'Leg {i + 1}: invalid date, duration_days or coordinates. Use YYYY-MM-DD dates'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+            
+            if start_dt < next_start:
+                error_msg = {
+                    'ja': f'区間{i + 1}: 開始日は今日以降かつ前の区間の終了後である必要があります',
+                    'en': f'Leg {i + 1}: must start today or later and after the previous leg ends'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+            
+            end_dt = start_dt + timedelta(days=duration_days - 1)
+            legs.append({
+                'location': location or f"Location ({latitude}, {longitude})",
+                'prefecture': '',
+                'latitude': latitude if has_coordinates else None,
+                'longitude': longitude if has_coordinates else None,
+                'start_date': start_dt.strftime('%Y-%m-%d'),
+                'end_date': end_dt.strftime('%Y-%m-%d'),
+                'duration_days': duration_days
+            })
+            next_start = end_dt + timedelta(days=1)
+        
+        if (next_start - today).days > 8:
+            error_msg = {
+                'ja': '天気予報は7日先までしか利用できません。すべての区間を7日以内に収めてください',
+                'en': 'Weather forecast only available up to 7 days ahead. All legs must end within 7 days'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language],
+                'max_date': (today + timedelta(days=7)).strftime('%Y-%m-%d')
+            }), 400
+        
+        # Resolve every leg and fetch its forecast at the same time
+        priority = current_priority()
+        prepared = [executor.submit(prepare_leg, leg, language, priority) for leg in legs]
+        leg_summaries = []
+        for i, job in enumerate(prepared):
+            try:
+                legs[i], summaries = job.result()
+            except LocationNotFound as e:
+                error_msg = {
+                    'ja': f'場所が見つかりません: {e.args[0]}。Tokyo、Osaka、Kyotoなどの英語の都市名を試してください',
+                    'en': f'Could not find location: {e.args[0]}. Try using city names like Tokyo, Osaka, or Kyoto'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 404
+            except requests.exceptions.RequestException as e:
+                error_msg = {
+                    'ja': f'区間{i + 1}の天気APIに失敗しました: {str(e)}',
+                    'en': f'Weather API failed for leg {i + 1}: {str(e)}'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 500
+            
+            if not summaries:
+                error_msg = {
+                    'ja': f'区間{i + 1}の天気データが利用できません',
+                    'en': f'No weather data available for leg {i + 1}'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 500
+            leg_summaries.append(summaries)
+        
+        # Generate every leg at the same time
+        jobs = []
+        for i, leg in enumerate(legs):
+            leg_query = ' '.join(filter(None, [user_query, format_route_context(language, legs, i)]))
+            prompt = build_itinerary_prompt(
+                language, leg['location'], leg['prefecture'], leg['start_date'],
+                datetime.strptime(leg['start_date'], '%Y-%m-%d'), leg['duration_days'],
+                preferences, leg_query, format_weather_summary(leg_summaries[i])
+            )
+            jobs.append(llm_executor.submit(call_gemini_streaming, prompt, priority=priority))
+        
+        itinerary = []
+        failed_legs = []
+        for i, job in enumerate(jobs):
+            try:
+                leg_days = extract_json(job.result()).get('itinerary')
+            except QuotaExceeded:
+                raise
+            except Exception:
+                leg_days = None
+            
+            # A leg with fewer days than requested would drop dates and shift later day numbers
+            if (not isinstance(leg_days, list) or len(leg_days) < legs[i]['duration_days']
+                    or not all(isinstance(d, dict) for d in leg_days)):
+                failed_legs.append(i + 1)
+                continue
+            
+            start_dt = datetime.strptime(legs[i]['start_date'], '%Y-%m-%d')
+            for offset, day_plan in enumerate(leg_days[:legs[i]['duration_days']]):
+                day_plan['day'] = len(itinerary) + 1
+                day_plan['date'] = (start_dt + timedelta(days=offset)).strftime('%Y-%m-%d')
+                day_plan['leg'] = i
+                day_plan['location'] = legs[i]['location']
+                itinerary.append(day_plan)
+        
+        if failed_legs:
+            error_msg = {
+                'ja': f'区間 {", ".join(map(str, failed_legs))} の旅程を生成できませんでした',
+                'en': f'Failed to generate the itinerary for leg(s) {", ".join(map(str, failed_legs))}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language],
+                'failed_legs': failed_legs
+            }), 500
+        
+        itinerary_id = uuid.uuid4().hex
+        result = {
+            'success': True,
+            'itinerary_id': itinerary_id,
+            'query': {
+                'location': ' → '.join(leg['location'] for leg in legs),
+                'prefecture': '',
+                'start_date': legs[0]['start_date'],
+                'end_date': legs[-1]['end_date'],
+                'duration_days': len(itinerary),
+                'preferences': preferences,
+                'user_query': user_query,
+                'language': language
+            },
+            'legs': legs,
+            'weather_summary': [
+                dict(ds, leg=i, location=legs[i]['location'])
+                for i, summaries in enumerate(leg_summaries) for ds in summaries
+            ],
+            'itinerary': itinerary,
+            'llm_provider': 'gemini'
+        }
+        
+        get_store().set(f'itinerary:{itinerary_id}', result, ITINERARY_TTL)
+        
+        return jsonify(result), 200
+        
+    except QuotaExceeded as e:
+        error_msg = {
+            'ja': f'外部APIの利用上限に達しました。{e.retry_after}秒後に再試行してください',
+            'en': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en'])
+        }), 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        error_msg = {
+            'ja': f'内部サーバーエラー: {str(e)}',
+            'en': f'Internal server error: {str(e)}'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en']),
+            'error_type': type(e).__name__
+        }), 500
+
+@bp.route('/api/itinerary/<itinerary_id>', methods=['GET'])
+def get_itinerary(itinerary_id):
+    stored = get_store().get(f'itinerary:{itinerary_id}')
+    if not stored:
+        return jsonify({
+            'error': True,
+            'reason': f'Itinerary not found or expired: {itinerary_id}'
+        }), 404
+    return jsonify(stored), 200
+
+def _as_int(value):
+    """Coerce a JSON number or numeric string to int; None for booleans and anything else"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+@bp.route('/api/itinerary/<itinerary_id>', methods=['PATCH'])
+def update_itinerary(itinerary_id):
+    language = 'en'
+    try:
+        if not GEMINI_API_KEY:
+            return jsonify({
+                'error': True,
+                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
+            }), 500
+        
+        stored = get_store().get(f'itinerary:{itinerary_id}')
+        if not stored:
+            return jsonify({
+                'error': True,
+                'reason': f'Itinerary not found or expired: {itinerary_id}'
+            }), 404
+        
+        language = stored['query']['language']
+        data = request.get_json()
+        
+        if not data:
+            error_msg = {
+                'ja': 'リクエストボディはJSONである必要があります',
+                'en': 'Request body must be JSON'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 400
+        
+        days = stored['itinerary']
+        day = _as_int(data.get('day'))
+        schedule_index = data.get('schedule_index')
+        preferences = data.get('preferences', stored['query']['preferences'])
+        user_query = data.get('user_query', '')
+        
+        day_index = next((i for i, d in enumerate(days) if d.get('day') == day), None)
+        if day_index is None:
+            error_msg = {
+                'ja': f'day は 1〜{len(days)} の範囲で指定してください',
+                'en': f'day must be one of the itinerary days (1-{len(days)})'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 400
+        
+        schedule = days[day_index].get('schedule', [])
+        if schedule_index is not None:
+            schedule_index = _as_int(schedule_index)
+            if schedule_index is None or not 0 <= schedule_index < len(schedule):
+                error_msg = {
+                    'ja': f'schedule_index は 0〜{len(schedule) - 1} の範囲で指定してください',
+                    'en': f'schedule_index must be between 0 and {len(schedule) - 1}'
+                }
+                return jsonify({
+                    'error': True,
+                    'reason': error_msg[language]
+                }), 400
+        
+        if schedule_index is None:
+            prompt = build_day_prompt(stored, day_index, preferences, user_query)
+        else:
+            prompt = build_slot_prompt(stored, day_index, schedule_index, preferences, user_query)
+        
+        try:
+            llm_response = call_gemini_streaming(prompt)
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            error_msg = {
+                'ja': f'LLM生成に失敗しました: {str(e)}',
+                'en': f'LLM generation failed: {str(e)}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        try:
+            regenerated = extract_json(llm_response)
+        except json.JSONDecodeError as e:
+            error_msg = {
+                'ja': f'LLM応答をJSONとして解析できませんでした: {str(e)}',
+                'en': f'Failed to parse LLM response as JSON: {str(e)}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language],
+                'raw_response_preview': llm_response[:2000]
+            }), 500
+        
+        field = 'day' if schedule_index is None else 'schedule_item'
+        replacement = regenerated.get(field) if isinstance(regenerated, dict) else None
+        if not isinstance(replacement, dict) or (field == 'day' and not replacement.get('schedule')):
+            error_msg = {
+                'ja': f'無効な応答: "{field}"フィールドがありません',
+                'en': f'Invalid response: missing "{field}" field'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language],
+                'raw_response_preview': llm_response[:1000]
+            }), 500
+        
+        if schedule_index is None:
+            days[day_index] = _replacement_day(days[day_index], replacement)
+        else:
+            schedule[schedule_index] = replacement
+        
+        stored['updated'] = {
+            'day': day,
+            'schedule_index': schedule_index,
+            'updated_at': datetime.now().isoformat()
+        }
+        get_store().set(f'itinerary:{itinerary_id}', stored, ITINERARY_TTL)
+        
+        return jsonify(stored), 200
+        
+    except QuotaExceeded as e:
+        error_msg = {
+            'ja': f'外部APIの利用上限に達しました。{e.retry_after}秒後に再試行してください',
+            'en': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en'])
+        }), 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        error_msg = {
+            'ja': f'内部サーバーエラー: {str(e)}',
+            'en': f'Internal server error: {str(e)}'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en']),
+            'error_type': type(e).__name__
+        }), 500
+
+@bp.route('/api/itinerary/<itinerary_id>/refresh', methods=['POST'])
+def refresh_itinerary(itinerary_id):
+    language = 'en'
+    try:
+        if not GEMINI_API_KEY:
+            return jsonify({
+                'error': True,
+                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
+            }), 500
+        
+        stored = get_store().get(f'itinerary:{itinerary_id}')
+        if not stored:
+            return jsonify({
+                'error': True,
+                'reason': f'Itinerary not found or expired: {itinerary_id}'
+            }), 404
+        
+        query = stored['query']
+        language = query['language']
+        today = datetime.now().strftime('%Y-%m-%d')
+        start_date = max(query['start_date'], today)
+        
+        if start_date > query['end_date']:
+            error_msg = {
+                'ja': 'この旅程の日程はすべて過去です',
+                'en': 'All days of this itinerary are in the past'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 400
+        
+        legs = [leg for leg in stored.get('legs', [query]) if leg['end_date'] >= start_date]
+        try:
+            new_summaries = [
+                ds for summaries in fetch_leg_summaries(legs, start_date, current_priority())
+                for ds in summaries
+            ]
+        except requests.exceptions.RequestException as e:
+            error_msg = {
+                'ja': f'天気APIに失敗しました: {str(e)}',
+                'en': f'Weather API failed: {str(e)}'
+            }
+            return jsonify({
+                'error': True,
+                'reason': error_msg[language]
+            }), 500
+        
+        new_by_date = {ds['date']: ds for ds in new_summaries}
+        previous = list(stored['weather_summary'])
+        weather_changes = {}
+        for i, old in enumerate(previous):
+            new = new_by_date.get(old['date'])
+            if not new:
+                continue
+            changed = slot_changes(old, new)
+            if changed:
+                weather_changes[old['date']] = changed
+            stored['weather_summary'][i] = dict(old, **new)
+        
+        refresh_query = {
+            'ja': '天気予報が変わりました。新しい天気に合わせて予定を調整してください',
+            'en': 'The weather forecast changed. Adjust the plan to the new weather'
+        }[language]
+        
+        days = stored['itinerary']
+        day_dates = {i: _plan_date(stored, i) for i in range(len(days))}
+        jobs = {
+            i: llm_executor.submit(
+                call_gemini_streaming,
+                build_day_prompt(stored, i, query['preferences'], refresh_query),
+                priority=current_priority()
+            )
+            for i, date in day_dates.items()
+            if date in weather_changes
+        }
+        
+        refreshed_days = []
+        failed_days = []
+        # Changes not applied to any day keep their old forecast, so the next refresh detects them again
+        failed_dates = set(weather_changes) - {day_dates[i] for i in jobs}
+        for i, job in jobs.items():
+            try:
+                replacement = extract_json(job.result()).get('day')
+            except Exception:
+                replacement = None
+            
+            if not isinstance(replacement, dict) or not replacement.get('schedule'):
+                failed_days.append(days[i].get('day'))
+                failed_dates.add(day_dates[i])
+                continue
+            
+            days[i] = _replacement_day(days[i], replacement)
+            refreshed_days.append(days[i].get('day'))
+        
+        stored['weather_summary'] = [
+            old if old['date'] in failed_dates else ds
+            for ds, old in zip(stored['weather_summary'], previous)
+        ]
+        stored['updated'] = {
+            'refreshed_days': refreshed_days,
+            'updated_at': datetime.now().isoformat()
+        }
+        get_store().set(f'itinerary:{itinerary_id}', stored, ITINERARY_TTL)
+        
+        return jsonify(dict(
+            stored,
+            refreshed_days=refreshed_days,
+            failed_days=failed_days,
+            failed_dates=sorted(failed_dates),
+            weather_changes=weather_changes
+        )), 200
+        
+    except QuotaExceeded as e:
+        error_msg = {
+            'ja': f'外部APIの利用上限に達しました。{e.retry_after}秒後に再試行してください',
+            'en': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en'])
+        }), 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        error_msg = {
+            'ja': f'内部サーバーエラー: {str(e)}',
+            'en': f'Internal server error: {str(e)}'
+        }
+        return jsonify({
+            'error': True,
+            'reason': error_msg.get(language, error_msg['en']),
+            'error_type': type(e).__name__
+        }), 500
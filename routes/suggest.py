@@ -1,20 +1,118 @@
 from flask import Blueprint, request, jsonify
 import requests
 import json
-from config import GEOCODING_API, WEATHER_API, WEATHER_CONDITIONS, GEMINI_API_KEY
-from utils import call_gemini_streaming
+import math
+from cache import get_cache
+from config import WEATHER_CONDITIONS, GEMINI_API_KEY, SUGGEST_CANDIDATES, SUGGEST_TEMPERATURE_BAND
+from forecast import fetch_forecast
+from quota import QuotaExceeded
+from utils import call_gemini_streaming, geocode_search, weather_category, parse_coordinates, extract_json
+from venues import VENUES_BY_ID, catalog_suggestions, nearest_venues
 
 bp = Blueprint('suggest', __name__)
 
+def build_suggest_prompt(location_name, condition, temperature, preferences, user_query):
+    return f"""You are a music-focused local guide for Japan. Generate EXACTLY 5 diverse music activity suggestions.
+
+Location: {location_name}
+Weather: {condition}, {temperature}°C
+User Preferences: {', '.join(preferences) if preferences else 'None'}
+User Query: {user_query}
+
+Provide 5 activities with a good mix:
+- 2 venues (live music clubs, concert halls)
+- 1 shopping (record stores)
+- 1 playlist/streaming activity
+- 1 cafe or practice activity
+
+Include real venues: Tower Records, Blue Note Tokyo, Billboard Live, Disk Union, Shibuya WWW, etc.
+
+Return ONLY valid JSON (no markdown):
+
+{{
+  "suggestions": [
+    {{
+      "id": "sug_1",
+      "title": "活動タイトル（日本語）",
+      "title_en": "Activity Title (English)",
+      "type": "venue|shopping|playlist|food|cafe|practice",
+      "description": "詳細な説明を日本語で2-3文で記載。具体的な魅力や特徴を含める。",
+      "description_en": "Detailed 2-3 sentence description in English including specific appeal and features.",
+      "venue": "Venue name or null",
+      "address": "Full address or null",
+      "weather_match": "Why this activity suits the current weather conditions",
+      "link": "https://example.com or null",
+      "estimated_cost": "¥X,XXX-X,XXX or Free",
+      "duration": "X-X hours",
+      "best_time": "morning|afternoon|evening|anytime"
+    }}
+  ]
+}}
+
+CRITICAL: Return EXACTLY 5 suggestions with detailed, engaging descriptions."""
+
+def build_guided_prompt(location_name, condition, temperature, preferences, user_query, candidates):
+    """Shorter prompt that has the LLM choose among catalog venues and omit catalog fields"""
+    venue_lines = "\n".join(
+        f"- {v['id']} | {v['name']} | {v['type']} | {'indoor' if v['indoor'] else 'outdoor'} | "
+        f"{v['cost']} | {v['hours']} | {', '.join(v['genres'])}"
+        for v in candidates
+    )
+    return f"""You are a music-focused local guide for Japan. Generate EXACTLY 5 diverse music activity suggestions.
+
+Location: {location_name}
+Weather: {condition}, {temperature}°C
+User Preferences: {', '.join(preferences) if preferences else 'None'}
+User Query: {user_query}
+
+Mix: 2 venues, 1 shopping, 1 playlist/streaming activity, 1 cafe or practice activity.
+Choose places ONLY from these nearby venues (id | name | type | setting | cost | hours | genres):
+{venue_lines}
+
+Return ONLY valid JSON (no markdown). Set venue_id to a venue id above, or null for the playlist activity:
+
+{{
+  "suggestions": [
+    {{
+      "id": "sug_1",
+      "venue_id": "venue-id or null",
+      "title": "活動タイトル（日本語）",
+      "title_en": "Activity Title (English)",
+      "type": "venue|shopping|playlist|cafe|practice",
+      "description": "日本語で1-2文",
+      "description_en": "1-2 sentences in English",
+      "weather_match": "Why it suits the weather",
+      "duration": "X-X hours",
+      "best_time": "morning|afternoon|evening|anytime"
+    }}
+  ]
+}}"""
+
+def merge_catalog_fields(suggestion):
+    """Fill venue, address, link, cost and hours of a guided suggestion from the catalog"""
+    venue = VENUES_BY_ID.get(suggestion.pop('venue_id', None))
+    if venue:
+        suggestion.setdefault('venue', venue['name'])
+        suggestion.setdefault('address', venue['address'])
+        suggestion.setdefault('link', venue['link'])
+        suggestion.setdefault('estimated_cost', venue['cost'])
+        suggestion.setdefault('hours', venue['hours'])
+    for field in ('venue', 'address', 'link'):
+        suggestion.setdefault(field, None)
+    suggestion.setdefault('estimated_cost', 'Free')
+    return suggestion
+
+def precompute_key(location_name, category, temperature, preferences):
+    """Cache key of the precomputed suggestions for a city, weather category, temperature band and preference set"""
+    if not isinstance(temperature, (int, float)) or not isinstance(preferences, list):
+        return None
+    band = math.floor(temperature / SUGGEST_TEMPERATURE_BAND) * SUGGEST_TEMPERATURE_BAND
+    prefs = ','.join(sorted({str(p).strip().lower() for p in preferences}))
+    return f'suggest:{location_name}:{category}:{band}:{prefs}'
+
 @bp.route('/api/suggest-quick', methods=['POST'])
 def suggest_quick():
     try:
-        if not GEMINI_API_KEY:
-            return jsonify({
-                'error': True,
-                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
-            }), 500
-        
         data = request.get_json()
         
         if not data:
@@ -23,6 +121,19 @@ def suggest_quick():
                 'reason': 'Request body must be JSON'
             }), 400
         
+        mode = data.get('mode', 'llm')
+        if mode not in ('llm', 'guided', 'fast'):
+            return jsonify({
+                'error': True,
+                'reason': 'Invalid mode: use llm, guided or fast'
+            }), 400
+        
+        if mode != 'fast' and not GEMINI_API_KEY:
+            return jsonify({
+                'error': True,
+                'reason': 'Gemini API key not configured. Set GEMINI_API_KEY environment variable.'
+            }), 500
+        
         user_query = data.get('user_query', '')
         location = data.get('location')
         latitude = data.get('latitude')
@@ -37,101 +148,100 @@ def suggest_quick():
             }), 400
         
         if not latitude or not longitude:
-            geocode_params = {
-                'name': location,
-                'count': 1,
-                'language': 'ja',
-                'country': 'jp'
-            }
-            geo_response = requests.get(GEOCODING_API, params=geocode_params, timeout=10)
-            geo_response.raise_for_status()
-            geo_data = geo_response.json()
+            geo_results = geocode_search(location, language='ja', country='jp', count=1, route='suggest')
             
-            if 'results' not in geo_data or len(geo_data['results']) == 0:
+            if not geo_results:
                 return jsonify({
                     'error': True,
                     'reason': f'Could not geocode location: {location}'
                 }), 404
             
-            latitude = geo_data['results'][0]['latitude']
-            longitude = geo_data['results'][0]['longitude']
-            location_name = geo_data['results'][0]['name']
+            latitude = geo_results[0]['latitude']
+            longitude = geo_results[0]['longitude']
+            location_name = geo_results[0]['name']
         else:
+            try:
+                latitude, longitude = parse_coordinates(latitude, longitude)
+            except ValueError:
+                return jsonify({
+                    'error': True,
+                    'reason': 'latitude and longitude must be numbers within -90..90 and -180..180'
+                }), 400
             location_name = location if location else f"Location ({latitude}, {longitude})"
         
-        weather_params = {
-            'latitude': latitude,
-            'longitude': longitude,
-            'current_weather': 'true',
-            'timezone': 'Asia/Tokyo'
-        }
-        
-        if target_date:
-            weather_params['start_date'] = target_date
-            weather_params['end_date'] = target_date
-        else:
-            weather_params['forecast_days'] = 1
-        
-        weather_response = requests.get(WEATHER_API, params=weather_params, timeout=10)
-        weather_response.raise_for_status()
-        weather_data = weather_response.json()
+        weather_data = fetch_forecast(latitude, longitude, 'Asia/Tokyo', current=True)
         
         current = weather_data.get('current_weather', {})
         condition = WEATHER_CONDITIONS.get(current.get('weathercode', 0), 'Unknown')
         temperature = current.get('temperature', 'N/A')
+        category = weather_category(current.get('weathercode', 0))
         
-        prompt = f"""You are a music-focused local guide for Japan. Generate EXACTLY 5 diverse music activity suggestions.
-
-Location: {location_name}
-Weather: {condition}, {temperature}°C
-User Preferences: {', '.join(preferences) if preferences else 'None'}
-User Query: {user_query}
-
-Provide 5 activities with a good mix:
-- 2 venues (live music clubs, concert halls)
-- 1 shopping (record stores)
-- 1 playlist/streaming activity
-- 1 cafe or practice activity
-
-Include real venues: Tower Records, Blue Note Tokyo, Billboard Live, Disk Union, Shibuya WWW, etc.
-
-Return ONLY valid JSON (no markdown):
-
-{{
-  "suggestions": [
-    {{
-      "id": "sug_1",
-      "title": "活動タイトル（日本語）",
-      "title_en": "Activity Title (English)",
-      "type": "venue|shopping|playlist|food|cafe|practice",
-      "description": "詳細な説明を日本語で2-3文で記載。具体的な魅力や特徴を含める。",
-      "description_en": "Detailed 2-3 sentence description in English including specific appeal and features.",
-      "venue": "Venue name or null",
-      "address": "Full address or null",
-      "weather_match": "Why this activity suits the current weather conditions",
-      "link": "https://example.com or null",
-      "estimated_cost": "¥X,XXX-X,XXX or Free",
-      "duration": "X-X hours",
-      "best_time": "morning|afternoon|evening|anytime"
-    }}
-  ]
-}}
-
-CRITICAL: Return EXACTLY 5 suggestions with detailed, engaging descriptions."""
+        query = {
+            'location': location_name,
+            'latitude': float(latitude),
+            'longitude': float(longitude),
+            'date': target_date if target_date else 'today',
+            'weather': condition,
+            'temperature': temperature,
+            'user_query': user_query,
+            'preferences': preferences,
+            'mode': mode
+        }
+        
+        if mode == 'fast':
+            suggestions = catalog_suggestions(latitude, longitude, category)
+            if not suggestions:
+                return jsonify({
+                    'error': True,
+                    'reason': 'No catalog venues near this location; use mode llm or guided'
+                }), 404
+            return jsonify({
+                'success': True,
+                'query': query,
+                'suggestions': suggestions,
+                'llm_provider': 'catalog',
+                'partial': len(suggestions) < 5
+            }), 200
+        
+        if mode == 'llm' and not user_query:
+            key = precompute_key(location_name, category, temperature, preferences)
+            precomputed = get_cache().get(key) if key else None
+            if precomputed:
+                return jsonify({
+                    'success': True,
+                    'query': query,
+                    'suggestions': precomputed,
+                    'llm_provider': 'gemini',
+                    'precomputed': True
+                }), 200
+        
+        candidates = []
+        if mode == 'guided':
+            candidates = nearest_venues(latitude, longitude, category, k=SUGGEST_CANDIDATES)
+        
+        if mode == 'guided' and candidates:
+            prompt = build_guided_prompt(location_name, condition, temperature, preferences, user_query, candidates)
+        else:
+            prompt = build_suggest_prompt(location_name, condition, temperature, preferences, user_query)
 
-        suggestions = call_gemini_streaming(prompt)
+        try:
+            suggestions = call_gemini_streaming(prompt)
+        except QuotaExceeded:
+            # Out of LLM quota: answer from the venue catalog instead of failing
+            fallback = catalog_suggestions(latitude, longitude, category)
+            if not fallback:
+                raise
+            return jsonify({
+                'success': True,
+                'query': query,
+                'suggestions': fallback,
+                'llm_provider': 'catalog',
+                'degraded': True,
+                'partial': len(fallback) < 5
+            }), 200
         
         try:
-            suggestions_text = suggestions.strip()
-            
-            if suggestions_text.startswith('```'):
-                parts = suggestions_text.split('```')
-                if len(parts) >= 3:
-                    suggestions_text = parts[1]
-                    if suggestions_text.startswith('json'):
-                        suggestions_text = suggestions_text[4:].strip()
-            
-            suggestions_json = json.loads(suggestions_text)
+            suggestions_json = extract_json(suggestions)
             
             if 'suggestions' not in suggestions_json:
                 return jsonify({
@@ -140,6 +250,12 @@ CRITICAL: Return EXACTLY 5 suggestions with detailed, engaging descriptions."""
                     'raw_response': suggestions[:1000]
                 }), 500
             
+            if mode == 'guided' and candidates:
+                suggestions_json['suggestions'] = [
+                    merge_catalog_fields(suggestion) for suggestion in suggestions_json['suggestions']
+                    if isinstance(suggestion, dict)
+                ]
+            
             if len(suggestions_json['suggestions']) > 5:
                 suggestions_json['suggestions'] = suggestions_json['suggestions'][:5]
             elif len(suggestions_json['suggestions']) < 5:
@@ -158,22 +274,18 @@ CRITICAL: Return EXACTLY 5 suggestions with detailed, engaging descriptions."""
         
         result = {
             'success': True,
-            'query': {
-                'location': location_name,
-                'latitude': float(latitude),
-                'longitude': float(longitude),
-                'date': target_date if target_date else 'today',
-                'weather': condition,
-                'temperature': temperature,
-                'user_query': user_query,
-                'preferences': preferences
-            },
+            'query': query,
             'suggestions': suggestions_json['suggestions'],
             'llm_provider': 'gemini'
         }
         
         return jsonify(result), 200
         
+    except QuotaExceeded as e:
+        return jsonify({
+            'error': True,
+            'reason': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }), 503, {'Retry-After': str(e.retry_after)}
     except requests.exceptions.Timeout:
         return jsonify({
             'error': True,
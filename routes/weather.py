@@ -1,86 +1,147 @@
 from flask import Blueprint, request, jsonify
 import requests
-from config import GEOCODING_API, WEATHER_API, WEATHER_CONDITIONS
+from config import WEATHER_CONDITIONS
+from forecast import fetch_forecast, freshness_seconds
+from quota import QuotaExceeded
+from responses import cacheable
+from utils import geocode_search, parse_coordinates
 
 bp = Blueprint('weather', __name__)
 
+# Response field -> Open-Meteo hourly variable it is built from
+HOURLY_FIELDS = {
+    'temperature': 'temperature_2m',
+    'precipitation': 'precipitation',
+    'weathercode': 'weathercode',
+    'condition': 'weathercode',
+    'windspeed': 'windspeed_10m',
+    'humidity': 'relativehumidity_2m'
+}
+
+UNITS = {
+    'temperature': '°C',
+    'precipitation': 'mm',
+    'windspeed': 'km/h',
+    'humidity': '%'
+}
+
+
+def build_hourly_forecast(hourly, fields, limit, columnar=False):
+    """Build the hourly forecast for `fields`, as per-hour objects or parallel arrays"""
+    times = hourly.get('time', [])[:limit]
+    count = len(times)
+
+    columns = {'time': times}
+    for field in fields:
+        if field == 'condition':
+            codes = hourly.get('weathercode', [])
+            columns[field] = [WEATHER_CONDITIONS.get(code, 'Unknown') for code in codes[:count]]
+        else:
+            columns[field] = hourly.get(HOURLY_FIELDS[field], [])[:count]
+
+    if columnar:
+        return columns
+
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
 @bp.route('/api/weather', methods=['GET'])
+@cacheable(freshness_seconds)
 def weather():
     try:
         latitude = request.args.get('latitude')
         longitude = request.args.get('longitude')
         city = request.args.get('city')
         timezone = request.args.get('timezone', 'Asia/Tokyo')
+        fields_raw = request.args.get('fields')
+        response_format = request.args.get('format', 'rows')
+
+        if fields_raw:
+            fields = [f.strip() for f in fields_raw.split(',') if f.strip()]
+        else:
+            fields = ['current', *HOURLY_FIELDS]
+
+        if not fields:
+            return jsonify({
+                'error': True,
+                'reason': f'No fields requested. Valid fields: current, {", ".join(HOURLY_FIELDS)}'
+            }), 400
+
+        unknown = [f for f in fields if f != 'current' and f not in HOURLY_FIELDS]
+        if unknown:
+            return jsonify({
+                'error': True,
+                'reason': f'Unknown fields: {", ".join(unknown)}. '
+                          f'Valid fields: current, {", ".join(HOURLY_FIELDS)}'
+            }), 400
+
+        if response_format not in ('rows', 'columnar'):
+            return jsonify({
+                'error': True,
+                'reason': 'Invalid format: use rows or columnar'
+            }), 400
+
+        try:
+            days = int(request.args.get('days', 1))
+            hours = int(request.args.get('hours', days * 24))
+        except ValueError:
+            return jsonify({
+                'error': True,
+                'reason': 'days and hours must be integers'
+            }), 400
+
+        if days < 1 or days > 7 or hours < 0:
+            return jsonify({
+                'error': True,
+                'reason': 'days must be between 1 and 7 and hours must not be negative'
+            }), 400
+        hours = min(hours, days * 24)
 
         if city and (not latitude or not longitude):
-            geocode_params = {
-                'name': city,
-                'count': 1,
-                'language': 'ja',
-                'country': 'jp'
-            }
-            geo_response = requests.get(GEOCODING_API, params=geocode_params, timeout=10)
-            geo_response.raise_for_status()
-            geo_data = geo_response.json()
+            geo_results = geocode_search(city, language='ja', country='jp', count=1, route='weather')
 
-            if 'results' not in geo_data or len(geo_data['results']) == 0:
+            if not geo_results:
                 return jsonify({
                     'error': True,
                     'reason': f'Could not geocode city: {city}'
                 }), 404
 
-            latitude = geo_data['results'][0]['latitude']
-            longitude = geo_data['results'][0]['longitude']
-            city_name = geo_data['results'][0]['name']
+            latitude = geo_results[0]['latitude']
+            longitude = geo_results[0]['longitude']
+            city_name = geo_results[0]['name']
         elif not latitude or not longitude:
             return jsonify({
                 'error': True,
                 'reason': 'Missing required parameters: city OR (latitude AND longitude)'
             }), 400
         else:
+            try:
+                latitude, longitude = parse_coordinates(latitude, longitude)
+            except ValueError:
+                return jsonify({
+                    'error': True,
+                    'reason': 'latitude and longitude must be numbers within -90..90 and -180..180'
+                }), 400
             city_name = f"Location ({latitude}, {longitude})"
 
-        params = {
-            'latitude': latitude,
-            'longitude': longitude,
-            'hourly': 'temperature_2m,precipitation,weathercode,windspeed_10m,relativehumidity_2m',
-            'current_weather': 'true',
-            'timezone': timezone,
-            'forecast_days': 1
-        }
-
-        response = requests.get(WEATHER_API, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        hourly_fields = [f for f in fields if f != 'current'] if hours else []
+        include_current = 'current' in fields
+        if not hourly_fields and not include_current:
+            return jsonify({
+                'error': True,
+                'reason': 'Nothing to return: request current or set hours above 0'
+            }), 400
 
-        current = data.get('current_weather', {})
-        current_condition = WEATHER_CONDITIONS.get(
-            current.get('weathercode', 0),
-            'Unknown'
+        data = fetch_forecast(
+            latitude,
+            longitude,
+            timezone,
+            hourly=[HOURLY_FIELDS[f] for f in hourly_fields],
+            current=include_current,
+            forecast_days=days
         )
 
-        hourly = data.get('hourly', {})
-        hourly_forecast = []
-
-        if hourly:
-            times = hourly.get('time', [])
-            temps = hourly.get('temperature_2m', [])
-            precip = hourly.get('precipitation', [])
-            codes = hourly.get('weathercode', [])
-            wind = hourly.get('windspeed_10m', [])
-            humidity = hourly.get('relativehumidity_2m', [])
-
-            for i in range(min(24, len(times))):
-                hourly_forecast.append({
-                    'time': times[i],
-                    'temperature': temps[i],
-                    'precipitation': precip[i],
-                    'weathercode': codes[i],
-                    'condition': WEATHER_CONDITIONS.get(codes[i], 'Unknown'),
-                    'windspeed': wind[i],
-                    'humidity': humidity[i]
-                })
-
         result = {
             'success': True,
             'location': {
@@ -88,26 +149,40 @@ def weather():
                 'latitude': float(latitude),
                 'longitude': float(longitude),
                 'timezone': timezone
-            },
-            'current': {
+            }
+        }
+
+        if include_current:
+            current = data.get('current_weather', {})
+            result['current'] = {
                 'time': current.get('time'),
                 'temperature': current.get('temperature'),
                 'windspeed': current.get('windspeed'),
                 'winddirection': current.get('winddirection'),
                 'weathercode': current.get('weathercode'),
-                'condition': current_condition
-            },
-            'hourly_forecast': hourly_forecast,
-            'units': {
-                'temperature': '°C',
-                'precipitation': 'mm',
-                'windspeed': 'km/h',
-                'humidity': '%'
+                'condition': WEATHER_CONDITIONS.get(current.get('weathercode', 0), 'Unknown')
             }
+
+        if hourly_fields:
+            result['hourly_forecast'] = build_hourly_forecast(
+                data.get('hourly', {}),
+                hourly_fields,
+                hours,
+                columnar=response_format == 'columnar'
+            )
+
+        result['units'] = {
+            name: unit for name, unit in UNITS.items()
+            if name in hourly_fields or (include_current and name in ('temperature', 'windspeed'))
         }
 
         return jsonify(result), 200
 
+    except QuotaExceeded as e:
+        return jsonify({
+            'error': True,
+            'reason': f'Upstream quota exhausted, retry in {e.retry_after} seconds'
+        }), 503, {'Retry-After': str(e.retry_after)}
     except requests.exceptions.Timeout:
         return jsonify({
             'error': True,
@@ -122,4 +197,4 @@ def weather():
         return jsonify({
             'error': True,
             'reason': f'Internal server error: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
@@ -0,0 +1,25 @@
+import os
+import sys
+
+os.environ.setdefault('CACHE_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+import cache  # noqa: E402
+import metrics  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    """Give every test an empty in-process cache and fresh metrics"""
+    monkeypatch.setattr(cache, '_backends', {'cache': cache.MemoryCache(None), 'store': cache.MemoryCache(None)})
+    monkeypatch.setattr(cache, '_backends_pid', os.getpid())
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_gauges', {})
+    monkeypatch.setattr(metrics, '_windows', {})
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
@@ -0,0 +1,26 @@
+from benchmarks.run import compare
+
+
+def result(time, peak_bytes=1000):
+    return {'time': time, 'peak_bytes': peak_bytes}
+
+
+def test_small_case_slowdown_is_reported():
+    baseline = {'build_itinerary_prompt[ja,1d]': result(0.03)}
+    regressions = compare({'build_itinerary_prompt[ja,1d]': result(0.039)}, baseline, 0.25, 0.10)
+    assert regressions == [('build_itinerary_prompt[ja,1d]', 'time', 0.03, 0.039)]
+
+
+def test_slowdown_within_threshold_passes():
+    baseline = {'build_suggest_prompt': result(0.0131)}
+    assert compare({'build_suggest_prompt': result(0.016)}, baseline, 0.25, 0.10) == []
+
+
+def test_allocation_growth_needs_ratio_and_minimum_bytes():
+    baseline = {'small': result(1.0, 100), 'large': result(1.0, 10000)}
+    results = {'small': result(1.0, 300), 'large': result(1.0, 12000)}
+    assert compare(results, baseline, 0.25, 0.10) == [('large', 'peak_bytes', 10000, 12000)]
+
+
+def test_new_cases_are_not_compared():
+    assert compare({'new_case': result(5.0)}, {}, 0.25, 0.10) == []
@@ -0,0 +1,154 @@
+import os
+import pickle
+import time
+import pytest
+from cache import SharedDiskCache, RemoteCache, dumps, loads
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis-py calls RemoteCache makes"""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def _live(self, key):
+        if key in self.expiry and self.expiry[key] <= time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        return self.data[key] if self._live(key) else None
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        if ex is not None:
+            self.expiry[key] = time.time() + ex
+
+    def delete(self, key):
+        self.data.pop(key, None)
+        self.expiry.pop(key, None)
+
+    def incrby(self, key, amount):
+        value = int(self.data[key]) + amount if self._live(key) else amount
+        self.data[key] = value
+        return value
+
+    def expire(self, key, seconds):
+        self.expiry[key] = time.time() + seconds
+
+
+@pytest.fixture
+def disk(tmp_path):
+    return SharedDiskCache(str(tmp_path / 'cache' / 'cache.sqlite'), max_bytes=None)
+
+
+@pytest.fixture
+def remote():
+    return RemoteCache(FakeRedis())
+
+
+@pytest.fixture(params=['disk', 'remote'])
+def backend(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_roundtrip_json_values():
+    value = {'name': '東京', 'hours': [9, 12], 'nested': {'ok': True, 'none': None}}
+    assert loads(dumps(value)) == value
+    large = {'rows': ['x' * 50] * 100}
+    assert dumps(large)[:1] == b'z'
+    assert loads(dumps(large)) == large
+
+
+def test_loads_rejects_other_formats():
+    assert loads(pickle.dumps({'a': 1})) is None
+    assert loads(b'z' + b'not zlib') is None
+    assert loads(b'j{broken') is None
+
+
+def test_set_get_delete(backend):
+    assert backend.get('geo:tokyo') is None
+    backend.set('geo:tokyo', {'lat': 35.68}, 60)
+    assert backend.get('geo:tokyo') == {'lat': 35.68}
+    backend.delete('geo:tokyo')
+    assert backend.get('geo:tokyo') is None
+
+
+def test_get_many_set_many(backend):
+    backend.set_many({'a:1': 1, 'a:2': [2]}, 60)
+    assert backend.get_many(['a:1', 'a:2', 'a:3']) == {'a:1': 1, 'a:2': [2]}
+
+
+def test_incr(backend):
+    assert backend.incr('quota:x', 1, 60) == 1
+    assert backend.incr('quota:x', 2, 60) == 3
+    assert backend.incr('quota:x', -1, 60) == 2
+    assert backend.incr('quota:x', 0, 60) == 2
+
+
+def test_disk_expiry(disk, monkeypatch):
+    disk.set('f:1', 'soon', 10)
+    disk.incr('quota:x', 5, 10)
+    later = time.time() + 11
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert disk.get('f:1') is None
+    assert disk.incr('quota:x', 1, 10) == 1
+
+
+def test_disk_ignores_non_json_rows(disk):
+    blob = pickle.dumps({'a': 1})
+    disk._connect().execute(
+        'INSERT INTO cache VALUES (?, ?, ?, ?)', ('p:1', blob, time.time() + 60, len(blob))
+    )
+    assert disk.get('p:1') is None
+    assert disk.get_many(['p:1']) == {}
+
+
+def test_disk_shared_between_instances(disk):
+    other = SharedDiskCache(disk.path, max_bytes=None)
+    disk.set('k:1', 'v', 60)
+    other.incr('quota:x', 2, 60)
+    assert other.get('k:1') == 'v'
+    assert disk.incr('quota:x', 1, 60) == 3
+
+
+def test_disk_evicts_entries_closest_to_expiry(tmp_path):
+    disk = SharedDiskCache(str(tmp_path / 'c' / 'cache.sqlite'), max_bytes=100)
+    disk.EVICT_EVERY = 1
+    value = 'x' * 40
+    disk.set('e:late', value, 300)
+    disk.set('e:soon', value, 100)
+    disk.set('e:mid', value, 200)
+    assert disk.get('e:soon') is None
+    assert disk.get('e:mid') == value
+    assert disk.get('e:late') == value
+
+
+def test_disk_without_max_bytes_keeps_live_entries(disk):
+    disk.EVICT_EVERY = 1
+    for i in range(20):
+        disk.set(f'e:{i}', 'x' * 500, 60)
+    disk.set('e:gone', 'x', -1)
+    assert len(disk.get_many(f'e:{i}' for i in range(20))) == 20
+    count = disk._connect().execute("SELECT COUNT(*) FROM cache WHERE key = 'e:gone'").fetchone()[0]
+    assert count == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX permissions')
+def test_disk_refuses_shared_directory(tmp_path):
+    directory = tmp_path / 'open'
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    with pytest.raises(PermissionError):
+        SharedDiskCache(str(directory / 'cache.sqlite'))
+
+
+def test_remote_sets_ttl_once(remote):
+    remote.set('f:1', {'a': 1}, 0.2)
+    assert remote.client.expiry['f:1'] - time.time() == pytest.approx(1, abs=0.1)
+    remote.incr('quota:x', 1, 60)
+    first = remote.client.expiry['quota:x']
+    remote.incr('quota:x', 1, 120)
+    assert remote.client.expiry['quota:x'] == first
@@ -0,0 +1,121 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+import pytest
+import forecast
+import metrics
+from quota import QuotaExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(forecast, 'time', SimpleNamespace(time=clock.time))
+    monkeypatch.setattr(forecast, 'FORECAST_CACHE_TTL', 600)
+    monkeypatch.setattr(forecast, 'FORECAST_STALE_TTL', 3600)
+    return clock
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace the Open-Meteo call with one that answers any params and records them"""
+    calls = []
+
+    def get_json(url, params, service, timeout=10, priority=None):
+        calls.append(dict(params))
+        if upstream.error:
+            raise upstream.error
+        start = date.fromisoformat(params['start_date'])
+        end = date.fromisoformat(params['end_date'])
+        days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        data = {'latitude': 35.7, 'longitude': 139.7, 'timezone': params['timezone']}
+        if 'hourly' in params:
+            times = [f'{day}T{hour:02d}:00' for day in days for hour in range(24)]
+            data['hourly'] = {'time': times}
+            for name in params['hourly'].split(','):
+                data['hourly'][name] = [float(i) for i in range(len(times))]
+        if 'daily' in params:
+            data['daily'] = {'time': days}
+            for name in params['daily'].split(','):
+                data['daily'][name] = [1.0] * len(days)
+        if 'current_weather' in params:
+            data['current_weather'] = {'temperature': 20.0, 'weathercode': 61}
+        return data
+
+    upstream = SimpleNamespace(calls=calls, error=None)
+    monkeypatch.setattr(forecast, 'get_json', get_json)
+    return upstream
+
+
+def fetch(**kwargs):
+    kwargs.setdefault('start_date', '2025-10-08')
+    kwargs.setdefault('end_date', '2025-10-09')
+    return forecast.fetch_forecast(35.68, 139.69, **kwargs)
+
+
+def test_requests_only_declared_fields(clock, upstream):
+    result = fetch(hourly=['temperature_2m'], daily=['weathercode'])
+    assert upstream.calls[0]['hourly'] == 'temperature_2m'
+    assert upstream.calls[0]['daily'] == 'weathercode'
+    assert 'current_weather' not in upstream.calls[0]
+    assert set(result) == {'latitude', 'longitude', 'timezone', 'hourly', 'daily'}
+    assert set(result['hourly']) == {'time', 'temperature_2m'}
+
+
+def test_covered_query_reuses_cached_response(clock, upstream):
+    fetch(hourly=['temperature_2m', 'weathercode'], daily=['temperature_2m_max'])
+    clock.now += 300
+    result = fetch(hourly=['weathercode'], hours=[9, 18], start_date='2025-10-09', end_date='2025-10-09')
+    assert len(upstream.calls) == 1
+    assert result['hourly']['time'] == ['2025-10-09T09:00', '2025-10-09T18:00']
+    assert set(result['hourly']) == {'time', 'weathercode'}
+    assert 'daily' not in result
+
+
+def test_wider_query_fetches_again(clock, upstream):
+    fetch(hourly=['temperature_2m'])
+    fetch(hourly=['temperature_2m', 'precipitation'])
+    fetch(hourly=['temperature_2m'], end_date='2025-10-10')
+    fetch(hourly=['temperature_2m'], current=True)
+    assert len(upstream.calls) == 4
+    fetch(hourly=['precipitation'], start_date='2025-10-09')
+    fetch(hourly=['temperature_2m'], current=True, end_date='2025-10-08')
+    assert len(upstream.calls) == 4
+
+
+def test_expired_response_is_refetched(clock, upstream):
+    fetch(hourly=['temperature_2m'])
+    clock.now += 601
+    fetch(hourly=['temperature_2m'])
+    assert len(upstream.calls) == 2
+
+
+def test_other_location_is_not_reused(clock, upstream):
+    fetch(hourly=['temperature_2m'])
+    forecast.fetch_forecast(34.69, 135.50, hourly=['temperature_2m'], start_date='2025-10-08')
+    assert len(upstream.calls) == 2
+
+
+def test_stale_response_served_when_quota_is_spent(clock, upstream):
+    fresh = fetch(hourly=['temperature_2m'])
+    clock.now += 1800
+    upstream.error = QuotaExceeded('open-meteo', 'minute', 30)
+    assert fetch(hourly=['temperature_2m']) == fresh
+    assert metrics.counter('forecast.stale_served') == 1
+
+
+def test_quota_error_raised_without_stale_cover(clock, upstream):
+    fetch(hourly=['temperature_2m'])
+    upstream.error = QuotaExceeded('open-meteo', 'minute', 30)
+    with pytest.raises(QuotaExceeded):
+        fetch(hourly=['precipitation'])
+    clock.now += 3601
+    with pytest.raises(QuotaExceeded):
+        fetch(hourly=['temperature_2m'])
@@ -0,0 +1,172 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import metrics
+import utils
+
+HEDGE_DELAY = 0.05
+
+
+class Stream:
+    """Scripted generation: optionally waits for `release`, then yields chunks or raises"""
+
+    def __init__(self, chunks=(), error=None, release=None):
+        self.chunks = chunks
+        self.error = error
+        self.release = release
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.release is not None:
+            self.release.wait(5)
+        for text in self.chunks:
+            yield SimpleNamespace(text=text)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeClient:
+    """Stand-in for genai.Client that hands out one scripted stream per call"""
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.calls = 0
+        self.models = SimpleNamespace(generate_content_stream=self.generate_content_stream)
+
+    def generate_content_stream(self, model, contents, config):
+        stream = self.streams[self.calls]
+        self.calls += 1
+        return stream
+
+
+@pytest.fixture
+def release():
+    """Event that stalled streams wait on; set at teardown so no thread outlives its test"""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def warmed(monkeypatch):
+    """Enough time-to-first-token samples for the hedge delay to be HEDGE_DELAY"""
+    monkeypatch.setattr(utils, 'GEMINI_HEDGE_MIN_SAMPLES', 3)
+    for _ in range(3):
+        metrics.observe('gemini.ttft', HEDGE_DELAY)
+
+
+def hedged(client):
+    return utils._call_gemini_hedged(client, 'prompt', 'interactive')
+
+
+def test_without_samples_behaves_like_plain_stream():
+    client = FakeClient(Stream(['hello', ' world']))
+    assert hedged(client) == 'hello world'
+    assert client.calls == 1
+    assert metrics.counter('gemini.hedge.fired') == 0
+
+
+def test_fast_primary_wins_without_hedge(warmed):
+    client = FakeClient(Stream(['a', 'b', 'c']))
+    assert hedged(client) == 'abc'
+    assert client.calls == 1
+    assert metrics.counter('gemini.hedge.fired') == 0
+    assert metrics.sample_count('gemini.ttft') == 4
+
+
+def test_hedge_wins_when_primary_stalls(warmed, release):
+    primary = Stream(['slow'], release=release)
+    client = FakeClient(primary, Stream(['fast', ' answer']))
+    assert hedged(client) == 'fast answer'
+    assert client.calls == 2
+    assert metrics.counter('gemini.hedge.fired') == 1
+    assert metrics.counter('gemini.hedge.won') == 1
+
+    release.set()
+    assert primary.closed.wait(2)
+
+
+def test_hedge_win_records_wait_from_first_attempt(warmed, release):
+    client = FakeClient(Stream(['slow'], release=release), Stream(['fast']))
+    started = time.monotonic()
+    assert hedged(client) == 'fast'
+    waited = time.monotonic() - started
+
+    sample = metrics._windows['gemini.ttft'][-1]
+    assert HEDGE_DELAY <= sample <= waited
+
+
+def test_primary_wins_race_after_hedge_fired(warmed, release):
+    hedge_release = threading.Event()
+    client = FakeClient(Stream(['first'], release=release), Stream(['second'], release=hedge_release))
+    threading.Timer(HEDGE_DELAY * 3, release.set).start()
+    try:
+        assert hedged(client) == 'first'
+    finally:
+        hedge_release.set()
+    assert client.calls == 2
+    assert metrics.counter('gemini.hedge.won') == 0
+
+
+def test_hedge_suppressed_when_rate_is_spent(warmed, monkeypatch, release):
+    monkeypatch.setattr(utils, 'GEMINI_HEDGE_MAX_RATE', 0.1)
+    for _ in range(5):
+        metrics.observe('gemini.hedged', 1)
+    client = FakeClient(Stream(['late'], release=release))
+    threading.Timer(HEDGE_DELAY * 3, release.set).start()
+    assert hedged(client) == 'late'
+    assert client.calls == 1
+    assert metrics.counter('gemini.hedge.suppressed') == 1
+
+
+def test_hedge_suppressed_when_quota_refuses(warmed, monkeypatch, release):
+    def refuse(service, priority_name=None):
+        raise utils.quota.QuotaExceeded('gemini', 'minute', 10)
+
+    monkeypatch.setattr(utils.quota, 'acquire', refuse)
+    client = FakeClient(Stream(['late'], release=release))
+    threading.Timer(HEDGE_DELAY * 3, release.set).start()
+    assert hedged(client) == 'late'
+    assert client.calls == 1
+    assert metrics.counter('gemini.hedge.suppressed') == 1
+
+
+def test_primary_error_before_hedge_is_raised(warmed):
+    client = FakeClient(Stream(error=ValueError('bad request')))
+    with pytest.raises(ValueError, match='bad request'):
+        hedged(client)
+    assert client.calls == 1
+
+
+def test_primary_error_after_hedge_fired_uses_hedge(warmed, release):
+    hedge_release = threading.Event()
+    client = FakeClient(Stream(error=RuntimeError('primary'), release=release),
+                        Stream(['rescued'], release=hedge_release))
+
+    def fail_primary_then_answer():
+        release.set()
+        time.sleep(HEDGE_DELAY)
+        hedge_release.set()
+
+    threading.Timer(HEDGE_DELAY * 3, fail_primary_then_answer).start()
+    assert hedged(client) == 'rescued'
+    assert metrics.counter('gemini.hedge.won') == 1
+
+
+def test_both_attempts_failing_raises_primary_error(warmed, release):
+    client = FakeClient(Stream(error=RuntimeError('primary'), release=release),
+                        Stream(error=RuntimeError('hedge')))
+    threading.Timer(HEDGE_DELAY * 3, release.set).start()
+    with pytest.raises(RuntimeError, match='primary'):
+        hedged(client)
+    assert client.calls == 2
+
+
+def test_winner_error_mid_stream_is_raised(warmed):
+    client = FakeClient(Stream(['partial'], error=RuntimeError('dropped')))
+    with pytest.raises(RuntimeError, match='dropped'):
+        hedged(client)
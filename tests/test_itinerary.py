@@ -0,0 +1,240 @@
+import json
+from datetime import date, timedelta
+import pytest
+import routes.itinerary as itinerary
+
+
+def day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+class FakeForecast:
+    """Stand-in for fetch_forecast: hourly weather with a per-date weather code and precipitation"""
+
+    def __init__(self):
+        self.weather = {}
+        self.calls = []
+
+    def __call__(self, latitude, longitude, timezone, hourly=(), hours=None, start_date=None, end_date=None, **kwargs):
+        self.calls.append((latitude, longitude, start_date, end_date))
+        times, codes, precipitation = [], [], []
+        current = date.fromisoformat(start_date)
+        while current <= date.fromisoformat(end_date):
+            code, rain = self.weather.get((latitude, current.isoformat()), (0, 0.0))
+            for hour in sorted(hours):
+                times.append(f'{current.isoformat()}T{hour:02d}:00')
+                codes.append(code)
+                precipitation.append(rain)
+            current += timedelta(days=1)
+        return {'hourly': {
+            'time': times,
+            'temperature_2m': [20.0] * len(times),
+            'precipitation': precipitation,
+            'weathercode': codes
+        }}
+
+
+class FakeGemini:
+    """Stand-in for call_gemini_streaming that answers itinerary and day prompts from scripts"""
+
+    def __init__(self):
+        self.prompts = []
+        self.days_for = {}
+        self.fail_days = False
+
+    def __call__(self, prompt, hedge=None, priority=None):
+        self.prompts.append(prompt)
+        if '"itinerary"' in prompt:
+            count = next((n for name, n in self.days_for.items() if f'- City: {name}\n' in prompt), 1)
+            return json.dumps({'itinerary': [
+                {'day': 99, 'date': 'wrong', 'schedule': [{'time_slot': 'morning', 'activity': f'plan {i}'}]}
+                for i in range(count)
+            ]})
+        if self.fail_days:
+            return 'not json'
+        return json.dumps({'day': {'day': 99, 'date': 'wrong', 'schedule': [
+            {'time_slot': 'morning', 'activity': 'replanned'}
+        ]}})
+
+
+@pytest.fixture
+def forecast(monkeypatch):
+    fake = FakeForecast()
+    monkeypatch.setattr(itinerary, 'fetch_forecast', fake)
+    return fake
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(itinerary, 'GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(itinerary, 'call_gemini_streaming', fake)
+    return fake
+
+
+@pytest.fixture
+def geocode(monkeypatch):
+    places = {
+        'Tokyo': {'name': 'Tokyo', 'admin1': 'Tokyo', 'latitude': 35.69, 'longitude': 139.69},
+        'Kyoto': {'name': 'Kyoto', 'admin1': 'Kyoto', 'latitude': 35.01, 'longitude': 135.77}
+    }
+
+    def search(name, **kwargs):
+        return [places[name]] if name in places else []
+
+    monkeypatch.setattr(itinerary, 'geocode_search', search)
+    return places
+
+
+def create_route(client, *legs):
+    return client.post('/api/itinerary/route', json={'language': 'en', 'legs': list(legs)})
+
+
+def test_route_unknown_location_is_404(client, forecast, gemini, geocode):
+    response = create_route(client, {'location': 'Tokyo'}, {'location': 'Atlantis'})
+    assert response.status_code == 404
+    assert 'Atlantis' in response.json['reason']
+
+
+def test_route_internal_lookup_error_is_not_reported_as_missing_location(client, gemini, geocode, monkeypatch):
+    def broken(*args, **kwargs):
+        return {'hourly': {'time': ['2025-01-01T09:00']}}
+
+    monkeypatch.setattr(itinerary, 'fetch_forecast', broken)
+    response = create_route(client, {'location': 'Tokyo'})
+    assert response.status_code == 500
+    assert response.json['error_type'] == 'IndexError'
+
+
+def test_route_stamps_days_across_legs(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 2, 'Kyoto': 1}
+    response = create_route(client, {'location': 'Tokyo', 'duration_days': 2}, {'location': 'Kyoto'})
+    assert response.status_code == 200
+    days = response.json['itinerary']
+    assert [(d['day'], d['date'], d['leg'], d['location']) for d in days] == [
+        (1, day(0), 0, 'Tokyo'), (2, day(1), 0, 'Tokyo'), (3, day(2), 1, 'Kyoto')
+    ]
+
+
+def test_route_leg_with_too_few_days_fails(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 1, 'Kyoto': 1}
+    response = create_route(client, {'location': 'Tokyo', 'duration_days': 2}, {'location': 'Kyoto'})
+    assert response.status_code == 500
+    assert response.json['failed_legs'] == [1]
+
+
+def summary(morning=('Clear sky', 0.0), afternoon=('Clear sky', 0.0), evening=('Clear sky', 0.0)):
+    return {
+        slot: {'condition': condition, 'temperature': 20.0, 'precipitation': rain}
+        for slot, (condition, rain) in (('morning', morning), ('afternoon', afternoon), ('evening', evening))
+    }
+
+
+def test_slot_changes_ignores_changes_within_a_category():
+    old = summary(morning=('Clear sky', 0.0), evening=('Slight rain', 1.0))
+    new = summary(morning=('Mainly clear', 0.0), evening=('Heavy rain', 8.0))
+    assert itinerary.slot_changes(old, new) == []
+
+
+def test_slot_changes_reports_category_changes():
+    old = summary()
+    new = summary(afternoon=('Overcast', 0.0), evening=('Thunderstorm', 0.0))
+    assert itinerary.slot_changes(old, new) == ['afternoon', 'evening']
+
+
+def test_slot_changes_reports_precipitation_crossing_threshold():
+    threshold = itinerary.PRECIPITATION_THRESHOLD
+    old = summary(morning=('Overcast', 0.0), afternoon=('Overcast', threshold / 2), evening=('Overcast', None))
+    new = summary(morning=('Overcast', threshold), afternoon=('Overcast', threshold / 4), evening=('Overcast', 0.0))
+    assert itinerary.slot_changes(old, new) == ['morning']
+
+
+def create_city(client, location='Tokyo', days=3):
+    return client.post('/api/itinerary', json={
+        'language': 'en', 'location': location, 'date': day(0), 'duration_days': days
+    })
+
+
+def refresh(client, itinerary_id):
+    return client.post(f'/api/itinerary/{itinerary_id}/refresh')
+
+
+def test_refresh_without_changes_regenerates_nothing(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 3}
+    created = create_city(client).json
+    prompts = len(gemini.prompts)
+    response = refresh(client, created['itinerary_id'])
+    assert response.status_code == 200
+    assert response.json['refreshed_days'] == []
+    assert response.json['weather_changes'] == {}
+    assert len(gemini.prompts) == prompts
+
+
+def test_refresh_regenerates_only_changed_days(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 3}
+    created = create_city(client).json
+    forecast.weather[(35.69, day(1))] = (63, 4.0)
+
+    response = refresh(client, created['itinerary_id'])
+    assert response.status_code == 200
+    assert response.json['weather_changes'] == {day(1): ['morning', 'afternoon', 'evening']}
+    assert response.json['refreshed_days'] == [2]
+    assert response.json['failed_dates'] == []
+    assert f'Regenerate ONLY Day 2 ({day(1)})' in gemini.prompts[-1]
+
+    days = response.json['itinerary']
+    assert [(d['day'], d['date']) for d in days] == [(1, day(0)), (2, day(1)), (3, day(2))]
+    assert days[1]['schedule'][0]['activity'] == 'replanned'
+    assert days[0]['schedule'][0]['activity'] == 'plan 0'
+
+    stored = client.get(f"/api/itinerary/{created['itinerary_id']}").json
+    assert stored['weather_summary'][1]['morning']['condition'] == 'Moderate rain'
+    assert refresh(client, created['itinerary_id']).json['refreshed_days'] == []
+
+
+def test_refresh_keeps_old_summary_for_failed_dates(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 3}
+    created = create_city(client).json
+    forecast.weather[(35.69, day(2))] = (63, 4.0)
+    gemini.fail_days = True
+
+    response = refresh(client, created['itinerary_id'])
+    assert response.json['failed_days'] == [3]
+    assert response.json['failed_dates'] == [day(2)]
+    assert response.json['weather_summary'][2]['morning']['condition'] == 'Clear sky'
+    assert response.json['itinerary'][2]['schedule'][0]['activity'] == 'plan 2'
+
+    gemini.fail_days = False
+    response = refresh(client, created['itinerary_id'])
+    assert response.json['refreshed_days'] == [3]
+    assert response.json['weather_summary'][2]['morning']['condition'] == 'Moderate rain'
+
+
+def test_refresh_reports_changes_without_a_plan_day(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 1}
+    created = create_city(client, days=3).json
+    assert len(created['itinerary']) == 1
+    forecast.weather[(35.69, day(2))] = (63, 4.0)
+
+    response = refresh(client, created['itinerary_id'])
+    assert response.json['refreshed_days'] == []
+    assert response.json['failed_dates'] == [day(2)]
+    assert response.json['weather_summary'][2]['morning']['condition'] == 'Clear sky'
+
+
+def test_refresh_maps_route_days_to_their_leg(client, forecast, gemini, geocode):
+    gemini.days_for = {'Tokyo': 2, 'Kyoto': 2}
+    created = create_route(
+        client, {'location': 'Tokyo', 'duration_days': 2}, {'location': 'Kyoto', 'duration_days': 2}
+    ).json
+    forecast.weather[(35.01, day(2))] = (63, 4.0)
+    forecast.weather[(35.69, day(3))] = (63, 4.0)
+
+    response = refresh(client, created['itinerary_id'])
+    assert response.status_code == 200
+    assert response.json['weather_changes'] == {day(2): ['morning', 'afternoon', 'evening']}
+    assert response.json['refreshed_days'] == [3]
+    assert 'local music guide for Kyoto' in gemini.prompts[-1]
+
+    replanned = response.json['itinerary'][2]
+    assert (replanned['day'], replanned['date'], replanned['leg'], replanned['location']) == (3, day(2), 1, 'Kyoto')
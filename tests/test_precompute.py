@@ -0,0 +1,89 @@
+import json
+import pytest
+import requests
+import cache
+import precompute
+from quota import QuotaExceeded
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    shared = cache.SharedDiskCache(str(tmp_path / 'cache' / 'cache.sqlite'))
+    monkeypatch.setitem(cache._backends, 'cache', shared)
+    return shared
+
+
+@pytest.fixture
+def matrix(tmp_path):
+    path = tmp_path / 'matrix.json'
+    path.write_text(json.dumps({
+        'cities': ['Tokyo', 'Osaka'],
+        'conditions': {'clear': 'Clear sky', 'rain': 'Moderate rain'},
+        'temperature_bands': [10],
+        'preference_sets': [[], ['jazz']]
+    }))
+    return str(path)
+
+
+@pytest.fixture
+def geocode(monkeypatch):
+    lookups = {}
+
+    def search(name, **kwargs):
+        outcome = lookups.get(name, [{'name': name}])
+        if isinstance(outcome, list) and outcome and isinstance(outcome[0], Exception):
+            outcome = outcome.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(precompute, 'geocode_search', search)
+    monkeypatch.setattr(precompute.time, 'sleep', lambda seconds: None)
+    return lookups
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    prompts = []
+
+    def generate(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return json.dumps({'suggestions': [{'id': f'sug_{i}'} for i in range(5)]})
+
+    monkeypatch.setattr(precompute, 'call_gemini_streaming', generate)
+    return prompts
+
+
+def test_refuses_in_process_cache(matrix, geocode, gemini, capsys):
+    assert precompute.main(['--matrix', matrix]) == 2
+    assert 'in-process' in capsys.readouterr().err
+    assert gemini == []
+
+
+def test_generates_missing_keys_and_resumes_from_cache(shared_cache, matrix, geocode, gemini):
+    assert precompute.main(['--matrix', matrix]) == 0
+    assert len(gemini) == 8
+
+    shared_cache.delete(precompute.precompute_key('Osaka', 'rain', 12.5, ['jazz']))
+    assert precompute.main(['--matrix', matrix]) == 0
+    assert len(gemini) == 9
+    assert 'Osaka' in gemini[-1]
+
+
+def test_city_with_failed_geocoding_is_skipped(shared_cache, matrix, geocode, gemini, capsys):
+    geocode['Osaka'] = requests.Timeout('read timed out')
+    assert precompute.main(['--matrix', matrix]) == 0
+    assert len(gemini) == 4
+    assert 'Skipping Osaka: geocoding failed' in capsys.readouterr().err
+
+
+def test_minute_quota_during_geocoding_is_waited_out(shared_cache, matrix, geocode, gemini):
+    geocode['Tokyo'] = [QuotaExceeded('open-meteo', 'minute', 5), {'name': 'Tokyo'}]
+    assert precompute.resolve_cities(['Tokyo']) == {'Tokyo': 'Tokyo'}
+
+
+def test_daily_quota_during_geocoding_stops_cleanly(shared_cache, matrix, geocode, gemini, capsys):
+    geocode['Osaka'] = QuotaExceeded('open-meteo', 'day', 3600)
+    assert precompute.main(['--matrix', matrix]) == 1
+    assert 'rerun in 3600s' in capsys.readouterr().err
+    assert gemini == []
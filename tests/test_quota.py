@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+import pytest
+import metrics
+import quota
+from cache import get_cache
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Enable quotas with a 10/minute, 1000/day gemini budget at a fixed clock"""
+    monkeypatch.setattr(quota, 'QUOTA_ENABLED', True)
+    monkeypatch.setattr(quota, 'QUOTA_LIMITS', {'gemini': (10, 1000)})
+    monkeypatch.setattr(quota, 'QUOTA_PRIORITY_SHARES', {'interactive': 0.95, 'standard': 0.8, 'bulk': 0.5})
+    monkeypatch.setattr(quota, 'time', SimpleNamespace(time=lambda: NOW))
+    return quota.QUOTA_LIMITS
+
+
+def granted(priority_name, attempts=20):
+    count = 0
+    for _ in range(attempts):
+        try:
+            quota.acquire('gemini', priority_name)
+        except quota.QuotaExceeded:
+            break
+        count += 1
+    return count
+
+
+def test_disabled_quota_counts_nothing(monkeypatch):
+    monkeypatch.setattr(quota, 'QUOTA_ENABLED', False)
+    for _ in range(50):
+        quota.acquire('gemini', 'bulk')
+    assert metrics.counter('quota.gemini.granted.bulk') == 0
+
+
+def test_unknown_service_is_not_limited(limits):
+    quota.acquire('geocoding', 'bulk')
+    assert quota.usage()['gemini']['minute']['used'] == 0
+
+
+@pytest.mark.parametrize('priority_name, expected', [('bulk', 5), ('standard', 8), ('interactive', 9)])
+def test_priority_shares(limits, priority_name, expected):
+    assert granted(priority_name) == expected
+
+
+def test_bulk_leaves_headroom_for_interactive(limits):
+    assert granted('bulk') == 5
+    assert granted('standard') == 3
+    assert granted('interactive') == 1
+    assert granted('bulk') == 0
+    assert quota.usage()['gemini']['minute'] == {'used': 9, 'limit': 10}
+
+
+def test_rejected_call_is_not_counted(limits):
+    granted('bulk')
+    for _ in range(5):
+        with pytest.raises(quota.QuotaExceeded):
+            quota.acquire('gemini', 'bulk')
+    assert quota.usage()['gemini']['minute']['used'] == 5
+    assert metrics.counter('quota.gemini.rejected.bulk') == 6
+
+
+def test_exceeded_reports_window_and_retry_after(limits):
+    granted('bulk')
+    with pytest.raises(quota.QuotaExceeded) as info:
+        quota.acquire('gemini', 'bulk')
+    assert info.value.window == 'minute'
+    assert info.value.retry_after == 60 - int(NOW % 60)
+
+
+def test_daily_limit_rolls_back_minute_count(limits, monkeypatch):
+    monkeypatch.setattr(quota, 'QUOTA_LIMITS', {'gemini': (10, 4)})
+    assert granted('bulk') == 2
+    with pytest.raises(quota.QuotaExceeded) as info:
+        quota.acquire('gemini', 'bulk')
+    assert info.value.window == 'day'
+    assert quota.usage()['gemini'] == {'minute': {'used': 2, 'limit': 10}, 'day': {'used': 2, 'limit': 4}}
+
+
+def test_priority_scope_outside_requests(limits):
+    assert quota.current_priority() == 'bulk'
+    with quota.priority('interactive'):
+        assert quota.current_priority() == 'interactive'
+        assert granted(None) == 9
+    assert quota.current_priority() == 'bulk'
+
+
+def test_windows_are_shared_through_the_cache(limits):
+    granted('bulk')
+    assert get_cache().incr('quota:gemini:minute:%d' % (NOW // 60), 0, 120) == 5
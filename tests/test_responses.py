@@ -0,0 +1,93 @@
+import gzip
+import pytest
+from flask import Flask, jsonify
+import responses
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    responses.init_app(app)
+    app.calls = 0
+
+    @app.route('/items/<int:count>')
+    @responses.cacheable(60)
+    def items(count):
+        app.calls += 1
+        return jsonify({'items': [{'id': i, 'name': f'item {i}'} for i in range(count)]})
+
+    @app.route('/missing')
+    @responses.cacheable(60)
+    def missing():
+        app.calls += 1
+        return jsonify({'error': True, 'padding': 'x' * 2000}), 404
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_small_response_gets_plain_etag(client):
+    response = client.get('/items/2', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    etag, weak = response.get_etag()
+    assert etag and not weak and not etag.endswith('-gzip')
+    assert response.headers['Cache-Control'] == 'public, max-age=60'
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_plain_etag_revalidates_with_304_before_the_view(app, client):
+    etag = client.get('/items/2').get_etag()[0]
+    response = client.get('/items/2', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    assert response.data == b''
+    assert app.calls == 1
+
+
+def test_large_response_is_gzipped_with_suffixed_etag(client):
+    response = client.get('/items/100', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.get_etag()[0].endswith('-gzip')
+    assert len(gzip.decompress(response.data)) >= responses.COMPRESSION_MIN_SIZE
+
+    identity = client.get('/items/100', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.get_etag()[0] + '-gzip' == response.get_etag()[0]
+
+
+def test_gzip_etag_revalidates_with_304(app, client):
+    etag = client.get('/items/100', headers={'Accept-Encoding': 'gzip'}).get_etag()[0]
+    response = client.get('/items/100', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    assert app.calls == 1
+
+
+def test_unknown_etag_runs_the_view(app, client):
+    client.get('/items/2')
+    response = client.get('/items/2', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert app.calls == 2
+
+
+def test_matching_etag_after_validator_expired_still_gets_304(app, client):
+    etag = client.get('/items/2').get_etag()[0]
+    responses.get_cache().delete('etag:/items/2?')
+    response = client.get('/items/2', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert app.calls == 2
+
+
+def test_error_responses_get_no_validator_or_compression(app, client):
+    response = client.get('/missing', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 404
+    assert response.get_etag() == (None, None)
+    assert 'Cache-Control' not in response.headers
+    assert 'Content-Encoding' not in response.headers
+    client.get('/missing')
+    assert app.calls == 2
@@ -0,0 +1,52 @@
+import pytest
+import routes.suggest as suggest
+from quota import QuotaExceeded
+
+SHIBUYA = {'latitude': 35.6595, 'longitude': 139.7005}
+SAPPORO = {'latitude': 43.0618, 'longitude': 141.3545}
+
+
+@pytest.fixture(autouse=True)
+def rainy(monkeypatch):
+    monkeypatch.setattr(suggest, 'fetch_forecast', lambda *args, **kwargs: {
+        'current_weather': {'temperature': 14.0, 'weathercode': 61}
+    })
+
+
+@pytest.fixture
+def llm_out_of_quota(monkeypatch):
+    def refuse(prompt, *args, **kwargs):
+        raise QuotaExceeded('gemini', 'minute', 20)
+
+    monkeypatch.setattr(suggest, 'GEMINI_API_KEY', 'test-key')
+    monkeypatch.setattr(suggest, 'call_gemini_streaming', refuse)
+
+
+def test_catalog_suggestions_need_a_nearby_venue():
+    assert suggest.catalog_suggestions(SAPPORO['latitude'], SAPPORO['longitude'], 'rain') == []
+    found = suggest.catalog_suggestions(SHIBUYA['latitude'], SHIBUYA['longitude'], 'rain')
+    assert any(s['type'] != 'playlist' for s in found)
+
+
+def test_fast_mode_answers_from_catalog(client):
+    response = client.post('/api/suggest-quick', json=dict(SHIBUYA, mode='fast'))
+    assert response.status_code == 200
+    assert response.json['llm_provider'] == 'catalog'
+    assert response.json['partial'] is (len(response.json['suggestions']) < 5)
+
+
+def test_fast_mode_without_nearby_venues_is_404(client):
+    response = client.post('/api/suggest-quick', json=dict(SAPPORO, mode='fast'))
+    assert response.status_code == 404
+
+
+def test_quota_fallback_uses_catalog(client, llm_out_of_quota):
+    response = client.post('/api/suggest-quick', json=dict(SHIBUYA, mode='llm'))
+    assert response.status_code == 200
+    assert response.json['degraded'] is True
+
+
+def test_quota_fallback_without_nearby_venues_is_503(client, llm_out_of_quota):
+    response = client.post('/api/suggest-quick', json=dict(SAPPORO, mode='llm'))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '20'
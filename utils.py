@@ -1,27 +1,371 @@
-from google import genai
-from config import GEMINI_API_KEY
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import metrics
+import quota
+from cache import get_cache
+from config import (
+    GEOCODING_API, GEOCODE_FALLBACK_MODES, GEOCODE_CACHE_TTL, GEMINI_API_KEY, GEMINI_HEDGE_ENABLED,
+    GEMINI_HEDGE_PERCENTILE, GEMINI_HEDGE_MIN_SAMPLES, GEMINI_HEDGE_MAX_RATE, LLM_WORKERS,
+    WEATHER_CONDITIONS, WEATHER_CATEGORIES
+)
 
-def call_gemini_streaming(prompt):
+GEMINI_MODEL = 'gemini-2.0-flash-exp'
+GEMINI_GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'max_output_tokens': 12000,
+    'top_p': 0.95,
+    'top_k': 40
+}
+
+_CONDITION_CODES = {name: code for code, name in WEATHER_CONDITIONS.items()}
+
+_pool_thread = threading.local()
+
+
+def _mark_upstream_thread():
+    _pool_thread.upstream = True
+
+
+class TrackedExecutor(ThreadPoolExecutor):
+    """Thread pool that keeps `pool.<name>.queued` and `pool.<name>.active` gauges"""
+
+    def __init__(self, name, workers, **kwargs):
+        super().__init__(max_workers=workers, thread_name_prefix=name, **kwargs)
+        self.name = name
+        self.workers = workers
+
+    def submit(self, fn, /, *args, **kwargs):
+        queued = f'pool.{self.name}.queued'
+        active = f'pool.{self.name}.active'
+
+        def run():
+            metrics.adjust(queued, -1)
+            metrics.adjust(active, 1)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.adjust(active, -1)
+
+        def dequeue_cancelled(future):
+            if future.cancelled():
+                metrics.adjust(queued, -1)
+
+        metrics.adjust(queued, 1)
+        future = super().submit(run)
+        future.add_done_callback(dequeue_cancelled)
+        return future
+
+
+# Threads start on first submit, so a preloaded master that never submits forks cleanly.
+# `executor` runs Open-Meteo calls and per-leg preparation; tasks on it must never wait
+# on other tasks of the same pool. LLM generations, which hold a thread for seconds,
+# get their own pool so they cannot starve quick upstream lookups.
+executor = TrackedExecutor('upstream', 16, initializer=_mark_upstream_thread)
+llm_executor = TrackedExecutor('llm', LLM_WORKERS)
+
+_gemini_client = None
+_gemini_client_pid = None
+_gemini_client_lock = threading.Lock()
+
+
+def gemini_client():
+    """Return this process's Gemini client, importing the SDK on first use.
+
+    The SDK is slow to import and its HTTP connections must not be shared
+    across fork, so the client is created lazily in each worker process.
+    """
+    global _gemini_client, _gemini_client_pid
+    if _gemini_client is not None and _gemini_client_pid == os.getpid():
+        return _gemini_client
+
+    with _gemini_client_lock:
+        if _gemini_client is None or _gemini_client_pid != os.getpid():
+            from google import genai
+            _gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+            _gemini_client_pid = os.getpid()
+    return _gemini_client
+
+
+def get_json(url, params, service, timeout=10, priority=None):
+    """GET an upstream JSON API, recording latency and errors under `service`.
+
+    The call is counted against the service's quota at `priority` (by default
+    that of the current request) and raises quota.QuotaExceeded when refused.
+    """
+    quota.acquire(service, priority)
+    started = time.monotonic()
+    try:
+        response = requests.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        metrics.incr(f'upstream.{service}.errors')
+        metrics.observe(f'upstream.{service}.failed', 1)
+        raise
+    finally:
+        metrics.incr(f'upstream.{service}.calls')
+        metrics.observe(f'upstream.{service}.latency', time.monotonic() - started)
+    metrics.observe(f'upstream.{service}.failed', 0)
+    return data
+
+
+def geocode_search(name, language='ja', country='jp', count=5, route='geocode'):
+    """Return geocoding results for `name`, falling back to an unfiltered query.
+
+    The fallback strategy comes from GEOCODE_FALLBACK_MODES for `route`. In
+    'parallel' mode the country-filtered and unfiltered lookups run at the
+    same time; filtered matches win and the unfiltered lookup is ignored.
+    Results are cached for GEOCODE_CACHE_TTL seconds.
+    """
+    mode = GEOCODE_FALLBACK_MODES.get(route, 'none')
+    key = f'geocode:{mode}:{country}:{language}:{count}:{name}'
+    results = get_cache().get(key)
+    if results is None:
+        results = _geocode_search(name, language, country, count, mode)
+        get_cache().set(key, results, GEOCODE_CACHE_TTL)
+    return results
+
+
+def _geocode_search(name, language, country, count, mode):
+    params = {
+        'name': name,
+        'count': count,
+        'language': language,
+        'format': 'json'
+    }
+
+    if not country:
+        return get_json(GEOCODING_API, params, 'geocoding').get('results') or []
+
+    filtered_params = dict(params, country=country)
+
+    # Inside an upstream pool task, waiting on two more tasks of the same pool could
+    # deadlock a saturated pool, so the lookups run one after the other instead.
+    if mode == 'parallel' and getattr(_pool_thread, 'upstream', False):
+        mode = 'sequential'
+
+    if mode == 'parallel':
+        priority = quota.current_priority()
+        filtered = executor.submit(get_json, GEOCODING_API, filtered_params, 'geocoding', priority=priority)
+        unfiltered = executor.submit(get_json, GEOCODING_API, params, 'geocoding', priority=priority)
+        try:
+            results = filtered.result().get('results') or []
+        except Exception:
+            unfiltered.cancel()
+            raise
+        if results:
+            unfiltered.cancel()
+            return results
+        return unfiltered.result().get('results') or []
+
+    results = get_json(GEOCODING_API, filtered_params, 'geocoding').get('results') or []
+    if not results and mode == 'sequential':
+        results = get_json(GEOCODING_API, params, 'geocoding').get('results') or []
+    return results
+
+
+def parse_coordinates(latitude, longitude):
+    """Return (latitude, longitude) as floats, or raise ValueError if either is not a valid coordinate"""
+    if isinstance(latitude, bool) or isinstance(longitude, bool):
+        raise ValueError('coordinates must be numbers')
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except TypeError:
+        raise ValueError('coordinates must be numbers')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('coordinates out of range')
+    return latitude, longitude
+
+
+def weather_category(condition):
+    """Map a weather code or WEATHER_CONDITIONS name to its coarse category"""
+    code = _CONDITION_CODES.get(condition, condition)
+    return WEATHER_CATEGORIES.get(code, 'unknown')
+
+
+def extract_json(text):
+    """Parse the JSON object in an LLM response, stripping code fences and surrounding prose"""
+    text = text.strip()
+
+    if text.startswith('```'):
+        parts = text.split('```')
+        if len(parts) >= 3:
+            text = parts[1]
+            if text.startswith('json'):
+                text = text[4:].strip()
+
+    if not text.startswith('{'):
+        json_match = re.search(r'\{.*\}', text, re.DOTALL)
+        if json_match:
+            text = json_match.group(0)
+
+    return json.loads(text)
+
+
+def call_gemini_streaming(prompt, hedge=None, priority=None):
     """Call Gemini with streaming to avoid timeout"""
+    if hedge is None:
+        hedge = GEMINI_HEDGE_ENABLED
+
+    priority = priority or quota.current_priority()
+    quota.acquire('gemini', priority)
+    metrics.adjust('gemini.inflight', 1)
+
     try:
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        
-        response_text = ""
-        
-        for chunk in client.models.generate_content_stream(
-            model='gemini-2.0-flash-exp',
-            contents=prompt,
-            config={
-                'temperature': 0.7,
-                'max_output_tokens': 12000,
-                'top_p': 0.95,
-                'top_k': 40
-            }
-        ):
-            if chunk.text:
-                response_text += chunk.text
-        
-        return response_text
-        
+        client = gemini_client()
+        metrics.incr('gemini.calls')
+
+        if hedge:
+            response_text = _call_gemini_hedged(client, prompt, priority)
+        else:
+            started = time.monotonic()
+            response_text = ""
+
+            for chunk in client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=GEMINI_GENERATION_CONFIG
+            ):
+                if chunk.text:
+                    if not response_text:
+                        metrics.observe('gemini.ttft', time.monotonic() - started)
+                    response_text += chunk.text
+
     except Exception as e:
-        raise Exception(f"Gemini API error: {str(e)}")
\ No newline at end of file
+        metrics.incr('gemini.errors')
+        metrics.observe('gemini.failed', 1)
+        raise Exception(f"Gemini API error: {str(e)}")
+    finally:
+        metrics.adjust('gemini.inflight', -1)
+
+    metrics.observe('gemini.failed', 0)
+    return response_text
+
+
+def _start_stream(client, prompt, attempt, events):
+    """Run one generation in a daemon thread, pushing (attempt, kind, payload) events"""
+    cancelled = threading.Event()
+
+    def run():
+        stream = None
+        try:
+            stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=GEMINI_GENERATION_CONFIG
+            )
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                if chunk.text:
+                    events.put((attempt, 'chunk', chunk.text))
+            events.put((attempt, 'done', None))
+        except Exception as e:
+            events.put((attempt, 'error', e))
+        finally:
+            close = getattr(stream, 'close', None)
+            if cancelled.is_set() and close:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return cancelled
+
+
+def _hedge_allowed():
+    hedge_rate = metrics.mean('gemini.hedged')
+    return hedge_rate is None or hedge_rate < GEMINI_HEDGE_MAX_RATE
+
+
+def _hedge_quota(priority):
+    try:
+        quota.acquire('gemini', priority)
+    except quota.QuotaExceeded:
+        return False
+    return True
+
+
+def _call_gemini_hedged(client, prompt, priority):
+    """Stream from Gemini, racing a second identical generation when the first stalls.
+
+    The hedge delay is the configured percentile of recent time-to-first-token;
+    until enough samples exist the call behaves like a plain stream. The first
+    attempt to produce text wins and the other is cancelled.
+    """
+    events = queue.Queue()
+    started = {0: time.monotonic()}
+    cancels = {0: _start_stream(client, prompt, 0, events)}
+    errors = {}
+
+    hedge_delay = None
+    if metrics.sample_count('gemini.ttft') >= GEMINI_HEDGE_MIN_SAMPLES:
+        hedge_delay = metrics.percentile('gemini.ttft', GEMINI_HEDGE_PERCENTILE)
+
+    winner = None
+    first_text = None
+    while winner is None:
+        timeout = None
+        if hedge_delay is not None and len(cancels) == 1:
+            timeout = max(0.0, started[0] + hedge_delay - time.monotonic())
+
+        try:
+            attempt, kind, payload = events.get(timeout=timeout)
+        except queue.Empty:
+            if _hedge_allowed() and _hedge_quota(priority):
+                started[1] = time.monotonic()
+                cancels[1] = _start_stream(client, prompt, 1, events)
+                metrics.incr('gemini.hedge.fired')
+                metrics.observe('gemini.hedged', 1)
+            else:
+                metrics.incr('gemini.hedge.suppressed')
+                metrics.observe('gemini.hedged', 0)
+            hedge_delay = None
+            continue
+
+        if kind == 'error':
+            errors[attempt] = payload
+            if len(errors) == len(cancels) and hedge_delay is None:
+                raise errors[0] if 0 in errors else payload
+            if hedge_delay is not None:
+                raise payload
+            continue
+
+        winner = attempt
+        if kind == 'chunk':
+            first_text = payload
+
+    if len(cancels) == 1 and hedge_delay is not None:
+        metrics.observe('gemini.hedged', 0)
+    if winner == 1:
+        metrics.incr('gemini.hedge.won')
+    if first_text is not None:
+        # Time the caller waited, measured from the first attempt: timing a winning
+        # hedge from its own start would hide the stall and pull the hedge delay down
+        metrics.observe('gemini.ttft', time.monotonic() - started[0])
+
+    for attempt, cancelled in cancels.items():
+        if attempt != winner:
+            cancelled.set()
+
+    response_text = first_text or ""
+    if first_text is None:
+        return response_text
+
+    while True:
+        attempt, kind, payload = events.get()
+        if attempt != winner:
+            continue
+        if kind == 'chunk':
+            response_text += payload
+        elif kind == 'done':
+            return response_text
+        else:
+            raise payload
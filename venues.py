@@ -0,0 +1,165 @@
+import json
+import math
+from config import VENUE_CATALOG_PATH, VENUE_CELL_DEGREES, VENUE_SEARCH_RADIUS_KM
+
+WET_CATEGORIES = {'rain', 'snow', 'thunderstorm'}
+KM_PER_DEGREE = 111.32
+
+# Suggestion mix used by the quick-suggestion prompt: 2 venues, 1 shop,
+# 1 playlist and 1 cafe or practice activity.
+SUGGESTION_MIX = (('venue',), ('venue',), ('shopping',), ('playlist',), ('cafe', 'practice'))
+
+
+def _cell(latitude, longitude):
+    return (math.floor(latitude / VENUE_CELL_DEGREES), math.floor(longitude / VENUE_CELL_DEGREES))
+
+
+def load_catalog(path=VENUE_CATALOG_PATH):
+    """Load the venue catalog and bucket venues into a fixed lat/lon grid"""
+    with open(path, encoding='utf-8') as f:
+        catalog = json.load(f)
+
+    buckets = {}
+    for venue in catalog['venues']:
+        buckets.setdefault(_cell(venue['latitude'], venue['longitude']), []).append(venue)
+
+    playlists = {playlist['category']: playlist for playlist in catalog['playlists']}
+    return catalog['venues'], buckets, playlists
+
+
+VENUES, _BUCKETS, PLAYLISTS = load_catalog()
+VENUES_BY_ID = {venue['id']: venue for venue in VENUES}
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def _ring(row, col, radius):
+    if radius == 0:
+        yield row, col
+        return
+    for d in range(-radius, radius + 1):
+        yield row - radius, col + d
+        yield row + radius, col + d
+    for d in range(-radius + 1, radius):
+        yield row + d, col - radius
+        yield row + d, col + radius
+
+
+def nearest_venues(latitude, longitude, category=None, k=10, types=None, radius_km=VENUE_SEARCH_RADIUS_KM):
+    """Return up to `k` catalog venues near a point, best first.
+
+    Outdoor venues are skipped when `category` is wet (rain, snow,
+    thunderstorm) and ranked as if 30% closer when it is clear. Grid rings
+    are searched outwards until no unvisited cell can hold a closer venue.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    row, col = _cell(latitude, longitude)
+    cell_km = VENUE_CELL_DEGREES * KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.1)
+    max_ring = math.ceil(radius_km / cell_km) + 1
+
+    found = []
+    for ring in range(max_ring + 1):
+        for cell in _ring(row, col, ring):
+            for venue in _BUCKETS.get(cell, ()):
+                if types and venue['type'] not in types:
+                    continue
+                if category in WET_CATEGORIES and not venue['indoor']:
+                    continue
+                distance = distance_km(latitude, longitude, venue['latitude'], venue['longitude'])
+                if distance > radius_km:
+                    continue
+                score = distance * 0.7 if category == 'clear' and not venue['indoor'] else distance
+                found.append((score, distance, venue))
+
+        if len(found) >= k:
+            found.sort(key=lambda item: item[0])
+            if found[k - 1][0] <= ring * cell_km * 0.7:
+                break
+
+    found.sort(key=lambda item: item[0])
+    return [dict(venue, distance_km=round(distance, 2)) for _, distance, venue in found[:k]]
+
+
+def weather_match(venue, category):
+    if category in WET_CATEGORIES:
+        return f'Indoor {venue["type"]}, a comfortable choice in {category}'
+    if not venue['indoor']:
+        return f'Outdoor spot, best enjoyed in {category} weather'
+    return 'Indoor venue, suitable for any weather'
+
+
+def to_suggestion(venue, category, index):
+    """Format a catalog venue (or playlist) like an LLM-generated suggestion"""
+    if 'category' in venue:
+        return {
+            'id': f'sug_{index}',
+            'title': venue['title'],
+            'title_en': venue['title_en'],
+            'type': 'playlist',
+            'description': venue['description'],
+            'description_en': venue['description_en'],
+            'venue': None,
+            'address': None,
+            'weather_match': f'Picked for {category} weather',
+            'link': None,
+            'estimated_cost': 'Free',
+            'duration': '1-2 hours',
+            'best_time': 'anytime'
+        }
+
+    return {
+        'id': f'sug_{index}',
+        'title': venue['name_ja'],
+        'title_en': venue['name'],
+        'type': venue['type'],
+        'description': venue['description'],
+        'description_en': venue['description_en'],
+        'venue': venue['name'],
+        'address': venue['address'],
+        'weather_match': weather_match(venue, category),
+        'link': venue['link'],
+        'estimated_cost': venue['cost'],
+        'duration': venue['duration'],
+        'best_time': venue['best_time'],
+        'hours': venue['hours'],
+        'distance_km': venue.get('distance_km')
+    }
+
+
+def catalog_suggestions(latitude, longitude, category, count=5):
+    """Ranked catalog suggestions following SUGGESTION_MIX, without any LLM call.
+
+    Returns an empty list when no venue is near the point: a weather playlist
+    on its own is not an answer for the location.
+    """
+    candidates = nearest_venues(latitude, longitude, category, k=30)
+    if not candidates:
+        return []
+    playlist = PLAYLISTS.get(category) or PLAYLISTS.get('cloudy')
+
+    picked = []
+    used = set()
+    for types in SUGGESTION_MIX:
+        if 'playlist' in types:
+            if playlist:
+                picked.append(playlist)
+            continue
+        match = next((v for v in candidates if v['type'] in types and v['id'] not in used), None)
+        if match:
+            picked.append(match)
+            used.add(match['id'])
+
+    for venue in candidates:
+        if len(picked) >= count:
+            break
+        if venue['id'] not in used:
+            picked.append(venue)
+            used.add(venue['id'])
+
+    return [to_suggestion(item, category, i + 1) for i, item in enumerate(picked[:count])]